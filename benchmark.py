@@ -0,0 +1,678 @@
+# Benchmarks for the Empathetic Code Reviewer
+# Run: python benchmark.py <benchmark> [options]
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import multiprocessing
+import platform
+import py_compile
+import random
+import re
+import string
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Tuple
+
+from e2 import (RENDERERS, EmpatheticCodeReviewer, KeywordMatcher, LocalRuleEngine, RateLimiter, ResponseCache,
+                SharedRateLimiter, run_batch, run_batch_processes)
+
+MOCK_FIELDS = {
+    "positive_rephrasing": "Nice start! Let's make this even clearer.",
+    "why_explanation": "Clear names and simple conditions make code easier to read and maintain.",
+    "code_improvement": "def get_active_users(users):\n"
+                        "    return [user for user in users if user.is_active and user.profile_complete]",
+}
+MOCK_COMPLETION = "\n".join(f"{field.upper()}: {value}" for field, value in MOCK_FIELDS.items())
+
+
+class MockLLMServer:
+    """In-process stub speaking the OpenAI chat-completions format.
+
+    latency is the mean response time in seconds (uniform +-50% jitter); error_rate and
+    rate_limit_rate are the fractions of requests answered with HTTP 500 and HTTP 429.
+    Requests with a response_format get JSON back; drift_rate is the fraction of answers
+    that leave out one of the feedback fields. script lists status codes to answer the first
+    requests with, in order, before the random mix applies. clients collects the client ports
+    seen, i.e. one entry per TCP connection; prompt_chars adds up the message text received.
+    With json_schema=False, requests with a json_schema response_format get HTTP 400, as
+    from endpoints that only support JSON mode. Requests with "stream": true are answered
+    as server-sent events, one delta per word, unless streaming=False.
+    """
+
+    def __init__(self, latency: float = 0.05, error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 retry_after: float = 0.1, seed: int = 0, drift_rate: float = 0.0, script: List[int] = None,
+                 json_schema: bool = True, streaming: bool = True):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.drift_rate = drift_rate
+        self.script = list(script or [])
+        self.json_schema = json_schema
+        self.streaming = streaming
+        self.clients = set()
+        self.prompt_chars = 0
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {"total": 0, "ok": 0, "errors": 0, "rate_limited": 0}
+        self.server = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_port}/openai/v1/chat/completions"
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                payload = json.loads(body or b"{}")
+                with mock.lock:
+                    mock.clients.add(self.client_address[1])
+                    mock.prompt_chars += sum(len(m.get("content", "")) for m in payload.get("messages", []))
+                status, delay = mock.decide(payload)
+                time.sleep(delay)
+                if status == 200:
+                    prompt_tokens = sum(len(m.get("content", "")) for m in payload.get("messages", [])) // 4
+                    content = mock.completion(payload)
+                    data = {
+                        "id": "chatcmpl-mock",
+                        "object": "chat.completion",
+                        "model": payload.get("model"),
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": content}}],
+                        "usage": {"prompt_tokens": prompt_tokens,
+                                  "completion_tokens": len(content) // 4,
+                                  "total_tokens": prompt_tokens + len(content) // 4},
+                    }
+                elif status == 400 and not mock.json_schema:
+                    data = {"error": {"message": "response_format json_schema is not supported by this model",
+                                      "type": "invalid_request_error", "code": status}}
+                else:
+                    data = {"error": {"message": "mock failure", "code": status}}
+                content_type = "application/json"
+                if status == 200 and payload.get("stream") and mock.streaming:
+                    encoded = mock.event_stream(data, payload).encode("utf-8")
+                    content_type = "text/event-stream"
+                else:
+                    encoded = json.dumps(data).encode("utf-8")
+                self.send_response(status)
+                if status == 429:
+                    self.send_header("Retry-After", str(mock.retry_after))
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(encoded)))
+                self.end_headers()
+                self.wfile.write(encoded)
+
+        class Server(ThreadingHTTPServer):
+            daemon_threads = True
+            request_queue_size = 128
+
+        self.server = Server(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def decide(self, payload: Dict):
+        with self.lock:
+            self.counts["total"] += 1
+            if not self.json_schema and (payload.get("response_format") or {}).get("type") == "json_schema":
+                self.counts["errors"] += 1
+                return 400, 0.0
+            roll = self.rng.random()
+            delay = self.latency * self.rng.uniform(0.5, 1.5)
+            if self.script:
+                status = self.script.pop(0)
+                self.counts["ok" if status == 200 else "rate_limited" if status == 429 else "errors"] += 1
+                return status, delay
+            if roll < self.rate_limit_rate:
+                self.counts["rate_limited"] += 1
+                return 429, 0.0
+            if roll < self.rate_limit_rate + self.error_rate:
+                self.counts["errors"] += 1
+                return 500, delay
+            self.counts["ok"] += 1
+            return 200, delay
+
+    def completion(self, payload: Dict) -> str:
+        with self.lock:
+            dropped = self.rng.choice(list(MOCK_FIELDS)) if self.rng.random() < self.drift_rate else None
+        response_format = payload.get("response_format")
+        numbers = self.batched_comments(payload)
+        if numbers and response_format:
+            return json.dumps({"feedback": [dict({"comment": number}, **{
+                field: value for field, value in MOCK_FIELDS.items() if field != dropped}) for number in numbers]})
+        if response_format:
+            schema = response_format.get("json_schema", {}).get("schema", {})
+            fields = [field for field in schema.get("properties", {}) if field in MOCK_FIELDS] or list(MOCK_FIELDS)
+            return json.dumps({field: MOCK_FIELDS[field] for field in fields if field != dropped})
+        block = "\n".join(f"{field.upper()}: {value}" for field, value in MOCK_FIELDS.items() if field != dropped)
+        if numbers:
+            return "\n".join(f"=== COMMENT {number} ===\n{block}" for number in numbers)
+        return block
+
+    @staticmethod
+    def event_stream(data: Dict, payload: Dict) -> str:
+        """A chat completion as chat.completion.chunk server-sent events, one delta per word
+
+        Like Groq, the finishing chunk carries the usage under x_groq; like OpenAI, a final
+        chunk with no choices carries it too when stream_options.include_usage is set.
+        """
+        content = data["choices"][0]["message"]["content"]
+        chunks = [{"choices": [{"index": 0, "delta": {"content": piece}}]}
+                  for piece in re.findall(r"\S+\s*|\s+", content)]
+        chunks.append({"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                       "x_groq": {"usage": data["usage"]}})
+        if (payload.get("stream_options") or {}).get("include_usage"):
+            chunks.append({"choices": [], "usage": data["usage"]})
+        return "".join(f"data: {json.dumps(dict(chunk, object='chat.completion.chunk'))}\n\n" for chunk in chunks) + \
+            "data: [DONE]\n\n"
+
+    @staticmethod
+    def batched_comments(payload: Dict) -> List[int]:
+        """Numbers of the comments in a batched prompt (see request_batched_feedback); [] for other prompts"""
+        prompt = payload.get("messages", [{}])[-1].get("content", "")
+        if "**Review comments:**" not in prompt or "one entry per comment" not in prompt and "=== COMMENT" not in prompt:
+            return []
+        listed = prompt.split("**Review comments:**", 1)[1]
+        return [int(number) for number in re.findall(r'^(\d+)\. "', listed, flags=re.MULTILINE)]
+
+    def reset_counts(self):
+        with self.lock:
+            self.counts = {key: 0 for key in self.counts}
+            self.prompt_chars = 0
+
+
+def serve_mock(latency: float, ports, stop):
+    with MockLLMServer(latency=latency) as server:
+        ports.put(server.server.server_port)
+        stop.wait()
+
+
+@contextlib.contextmanager
+def mock_server_process(latency: float):
+    """MockLLMServer in its own process, so serving requests does not compete with the code being measured"""
+    ports, stop = multiprocessing.Queue(), multiprocessing.Event()
+    process = multiprocessing.Process(target=serve_mock, args=(latency, ports, stop), daemon=True)
+    process.start()
+    try:
+        yield f"http://127.0.0.1:{ports.get(timeout=10)}/openai/v1/chat/completions"
+    finally:
+        stop.set()
+        process.join(timeout=5)
+
+
+def time_per_call(func: Callable, inputs: List[str], repeat: int = 3) -> float:
+    """Best-of-N average time per call in microseconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in inputs:
+            func(text)
+        best = min(best, time.perf_counter() - start)
+    return best / len(inputs) * 1e6
+
+
+def random_word(rng: random.Random) -> str:
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10)))
+
+
+def bench_matcher(sizes: List[int], samples: int = 2000):
+    """Compare the compiled KeywordMatcher with the old per-keyword `in` scans as the rules table grows"""
+    rng = random.Random(42)
+    texts = [
+        " ".join(random_word(rng) for _ in range(rng.randint(5, 30)))
+        for _ in range(samples)
+    ]
+
+    print(f"{'keywords':>10} {'linear scan (us)':>18} {'matcher (us)':>14} {'speedup':>9}")
+    for size in sizes:
+        keywords = [random_word(rng) for _ in range(size)]
+        # Seed some real hits so both paths do actual work
+        for i in range(0, len(texts), 10):
+            texts[i] += " " + rng.choice(keywords)
+
+        matcher = KeywordMatcher({"rule": keywords})
+
+        def linear_scan(text: str) -> List[str]:
+            text_lower = text.lower()
+            return [k for k in keywords if k in text_lower]
+
+        linear = time_per_call(linear_scan, texts)
+        compiled = time_per_call(matcher.find_keywords, texts)
+        print(f"{size:>10} {linear:>18.2f} {compiled:>14.2f} {linear / compiled:>8.1f}x")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def synthetic_review(rng: random.Random, comment_count: int, snippet_lines: int) -> Dict:
+    lines = ["def process(items):", "    results = []"]
+    for i in range(max(0, snippet_lines - 3)):
+        lines.append(f"    value_{i} = items[{i}] if items[{i}] == True else None  # {random_word(rng)}")
+    lines.append("    return results")
+    comments = [
+        rng.choice(["Variable '{w}' is a bad name.", "This loop over {w} is inefficient.",
+                    "Boolean comparison '== True' is redundant near {w}.", "Consider splitting {w}."])
+        .format(w=random_word(rng))
+        for _ in range(comment_count)
+    ]
+    return {"code_snippet": "\n".join(lines), "review_comments": comments}
+
+
+def bench_pipeline(comment_counts: List[int], snippet_sizes: List[int], reviews: int, concurrency: int,
+                   max_workers: int, latency: float, error_rate: float, rate_limit_rate: float,
+                   output: str, use_cache: bool = False):
+    """Drive process_review against the mock server and report latency percentiles and throughput"""
+    os.environ.setdefault("GROQ_API_KEY", "benchmark")
+    rng = random.Random(7)
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": {"reviews": reviews, "concurrency": concurrency, "max_workers": max_workers,
+                   "latency": latency, "error_rate": error_rate, "rate_limit_rate": rate_limit_rate,
+                   "cache": use_cache},
+        "workloads": [],
+    }
+
+    print(f"{'comments':>8} {'lines':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'reviews/s':>10} {'requests':>9}")
+    with MockLLMServer(latency=latency, error_rate=error_rate, rate_limit_rate=rate_limit_rate) as server:
+        for comment_count in comment_counts:
+            for snippet_lines in snippet_sizes:
+                reviewer = EmpatheticCodeReviewer(
+                    max_workers=max_workers, backoff_base=0.05,
+                    rate_limiter=RateLimiter(rate=10000, capacity=10000),
+                    cache=ResponseCache(bypass=not use_cache),
+                )
+                reviewer.base_url = server.url
+                workload = [synthetic_review(rng, comment_count, snippet_lines) for _ in range(reviews)]
+                latencies = []
+
+                def run_one(review: Dict):
+                    start = time.perf_counter()
+                    reviewer.process_review(review)
+                    latencies.append(time.perf_counter() - start)
+
+                server.reset_counts()
+                # Reviewer progress output is noise here
+                with contextlib.redirect_stdout(io.StringIO()):
+                    start = time.perf_counter()
+                    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                        list(pool.map(run_one, workload))
+                    elapsed = time.perf_counter() - start
+                reviewer.close()
+
+                row = {
+                    "comments": comment_count,
+                    "snippet_lines": snippet_lines,
+                    "p50_ms": percentile(latencies, 50) * 1000,
+                    "p95_ms": percentile(latencies, 95) * 1000,
+                    "p99_ms": percentile(latencies, 99) * 1000,
+                    "reviews_per_sec": reviews / elapsed,
+                    "elapsed_sec": elapsed,
+                    "requests": dict(server.counts),
+                }
+                results["workloads"].append(row)
+                print(f"{comment_count:>8} {snippet_lines:>6} {row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} "
+                      f"{row['p99_ms']:>8.1f} {row['reviews_per_sec']:>10.2f} {server.counts['total']:>9}")
+
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n💾 Results saved to '{output}'")
+    return results
+
+
+CORPUS_SNIPPETS = [
+    "def get_active_users(users):\n    results = []\n    for u in users:\n"
+    "        if u.is_active == True and u.profile_complete == True:\n            results.append(u)\n    return results",
+    "def total_price(orders):\n    total = 0\n    for i in range(len(orders)):\n"
+    "        total += orders[i].price * orders[i].quantity\n    return total",
+    "def names_of(accounts):\n    names = []\n    for a in accounts:\n        names.append(a.name.title())\n    return names",
+    "def load_config(path):\n    with open(path) as f:\n        data = json.load(f)\n"
+    "    if data.get('debug') == False:\n        data['level'] = 'info'\n    return data",
+    "class Cache:\n    def __init__(self):\n        self.store = {}\n\n"
+    "    def get(self, key):\n        if key in self.store:\n            return self.store[key]\n        return None",
+]
+
+CORPUS_COMMENTS = [
+    "Boolean comparison '== True' is redundant.",
+    "Don't compare to False with ==, use not.",
+    "Variable 'u' is a bad name.",
+    "'a' is a bad variable name.",
+    "Use enumerate or iterate directly instead of range(len(...)).",
+    "Build the list with a comprehension instead of append in a loop.",
+    "This is inefficient. Don't loop twice conceptually.",
+    "This function does too much, consider splitting it.",
+    "Missing error handling for a missing file.",
+    "Add a docstring explaining the return value.",
+    "Use dict.get instead of checking membership first.",
+    "Magic strings like 'info' should be constants.",
+]
+
+
+def review_corpus(rng: random.Random, reviews: int) -> List[Dict]:
+    """Reviews mixing comments a local rule can answer with ones only the LLM can"""
+    return [{"code_snippet": rng.choice(CORPUS_SNIPPETS),
+             "review_comments": rng.sample(CORPUS_COMMENTS, rng.randint(2, 5))}
+            for _ in range(reviews)]
+
+
+def bench_rules(reviews: int, latency: float):
+    """Count LLM calls for the same review corpus with and without the local rule engine"""
+    os.environ.setdefault("GROQ_API_KEY", "benchmark")
+    corpus = review_corpus(random.Random(11), reviews)
+    comment_count = sum(len(review["review_comments"]) for review in corpus)
+
+    print(f"{'mode':>12} {'comments':>9} {'LLM calls':>10} {'local':>6} {'seconds':>8}")
+    calls = {}
+    with MockLLMServer(latency=latency) as server:
+        for mode, engine in (("llm only", None), ("local rules", LocalRuleEngine())):
+            reviewer = EmpatheticCodeReviewer(max_workers=4, rate_limiter=RateLimiter(rate=10000, capacity=10000),
+                                              cache=ResponseCache(bypass=True), rule_engine=engine)
+            reviewer.base_url = server.url
+            server.reset_counts()
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                for review in corpus:
+                    reviewer.process_review(review)
+                elapsed = time.perf_counter() - start
+            reviewer.close()
+            # Every review also makes one summary call; the rules only save feedback calls
+            calls[mode] = server.counts["total"]
+            local = engine.stats["hits"] if engine else 0
+            print(f"{mode:>12} {comment_count:>9} {calls[mode]:>10} {local:>6} {elapsed:>8.2f}")
+
+    saved = calls["llm only"] - calls["local rules"]
+    print(f"\nLLM calls saved: {saved} of {calls['llm only']} ({saved / calls['llm only']:.0%}); "
+          f"feedback calls saved: {saved / comment_count:.0%} of {comment_count} comments")
+
+    engine = LocalRuleEngine()
+    pairs = [(review["code_snippet"], comment) for review in corpus for comment in review["review_comments"]]
+    covered = [pair for pair in pairs if engine.answer(*pair)]
+    if covered:
+        print(f"Local answer: {time_per_call(lambda pair: engine.answer(*pair), covered):.1f} us per covered comment")
+
+
+def bench_processes(counts: List[int], jobs: int, comments: int, snippet_lines: int, latency: float):
+    """Batch throughput with N threads vs N worker processes on a CPU-heavy synthetic workload"""
+    os.environ.setdefault("GROQ_API_KEY", "benchmark")
+    rng = random.Random(5)
+    workdir = tempfile.mkdtemp(prefix="empathetic-bench-")
+    input_path = os.path.join(workdir, "jobs.jsonl")
+    with open(input_path, "w", encoding="utf-8") as f:
+        for index in range(jobs):
+            f.write(json.dumps(dict(synthetic_review(rng, comments, snippet_lines), id=f"job-{index}")) + "\n")
+
+    print(f"{jobs} jobs x {comments} comments x {snippet_lines} lines, {os.cpu_count()} CPUs")
+    print(f"{'workers':>8} {'threads jobs/s':>15} {'processes jobs/s':>17} {'same output':>12}")
+    with mock_server_process(latency) as url:
+        options = {"base_url": url, "cache": False, "local_rules": True}
+        baseline = None
+        for count in counts:
+            rates = {}
+            outputs = {}
+            for mode in ("threads", "processes"):
+                output_path = os.path.join(workdir, f"{mode}-{count}.jsonl")
+                limiter = SharedRateLimiter(rate=100000, capacity=100000)
+                with contextlib.redirect_stderr(io.StringIO()):
+                    start = time.perf_counter()
+                    if mode == "threads":
+                        from e2 import make_batch_reviewer
+                        run_batch(input_path, output_path=output_path, workers=count,
+                                  reviewer=make_batch_reviewer(options, limiter))
+                    else:
+                        # Called directly so the 1-worker row really uses a single worker process
+                        run_batch_processes(input_path, output_path=output_path, processes=count,
+                                            reviewer_options=options, rate_limiter=limiter)
+                    rates[mode] = jobs / (time.perf_counter() - start)
+                with open(output_path, encoding="utf-8") as f:
+                    outputs[mode] = f.read()
+            # Thread mode writes as jobs finish; worker processes write in input order
+            ordered = "".join(sorted(outputs["threads"].splitlines(True), key=lambda line: json.loads(line)["index"]))
+            baseline = baseline or outputs["processes"]
+            same = ordered == outputs["processes"] == baseline
+            print(f"{count:>8} {rates['threads']:>15.1f} {rates['processes']:>17.1f} {str(same):>12}")
+
+
+def bench_batching(comment_counts: List[int], reviews: int, snippet_lines: int, latency: float, max_workers: int):
+    """LLM calls, prompt text sent and wall time for per-comment requests vs one batched request per review"""
+    os.environ.setdefault("GROQ_API_KEY", "benchmark")
+    rng = random.Random(17)
+    print(f"{reviews} reviews per row, {snippet_lines}-line snippets, {latency * 1000:.0f} ms mock latency, "
+          f"{max_workers} workers")
+    print(f"{'comments':>9} {'mode':>12} {'LLM calls':>10} {'prompt chars':>13} {'seconds':>8} {'identical':>10}")
+    with MockLLMServer(latency=latency) as server:
+        for count in comment_counts:
+            corpus = [synthetic_review(rng, count, snippet_lines) for _ in range(reviews)]
+            reports = {}
+            for mode in ("per-comment", "batched"):
+                reviewer = EmpatheticCodeReviewer(max_workers=max_workers, batch_comments=mode == "batched",
+                                                  rate_limiter=RateLimiter(rate=10000, capacity=10000),
+                                                  cache=ResponseCache(bypass=True))
+                reviewer.base_url = server.url
+                server.reset_counts()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    start = time.perf_counter()
+                    reports[mode] = [reviewer.process_review(review) for review in corpus]
+                    elapsed = time.perf_counter() - start
+                reviewer.close()
+                same = reports[mode] == reports["per-comment"]
+                print(f"{count:>9} {mode:>12} {server.counts['total']:>10} {server.prompt_chars:>13} "
+                      f"{elapsed:>8.2f} {str(same):>10}")
+    print("\nCall counts and prompt characters are measured at the mock server; every review also makes one"
+          "\nsummary call. Token counts depend on the model's tokenizer and are not estimated here.")
+
+
+def bench_formats(comments: int, drift_rate: float, latency: float):
+    """Format failures and wasted re-runs for the labelled-text format vs structured JSON output"""
+    os.environ.setdefault("GROQ_API_KEY", "benchmark")
+    rng = random.Random(3)
+    reviews = [synthetic_review(rng, 5, 10) for _ in range(max(1, comments // 5))]
+    print(f"{'format':>11} {'answers':>8} {'failed':>7} {'rate':>6} {'re-asks':>8} {'wasted':>7} "
+          f"{'blank in report':>16} {'LLM calls':>10}")
+    with MockLLMServer(latency=latency, drift_rate=drift_rate) as server:
+        for mode in ("text", "structured"):
+            reviewer = EmpatheticCodeReviewer(max_workers=4, rate_limiter=RateLimiter(rate=10000, capacity=10000),
+                                              cache=ResponseCache(bypass=True), structured_output=mode == "structured")
+            reviewer.base_url = server.url
+            server.reset_counts()
+            blanks = 0
+            with contextlib.redirect_stdout(io.StringIO()):
+                for review in reviews:
+                    report = reviewer.process_review(review)
+                    # An empty field renders as a label with nothing after it
+                    blanks += len(re.findall(r"\*\*(?:🌟 Positive Rephrasing|🧠 The 'Why'):\*\* *\n|```python\n\n```", report))
+            reviewer.close()
+            formats = reviewer.metrics.snapshot()["formats"]
+            print(f"{mode:>11} {formats['responses']:>8} {formats['failures']:>7} "
+                  f"{reviewer.metrics.format_failure_rate():>6.0%} {formats['reasks']:>8} {formats['wasted_reasks']:>7} "
+                  f"{blanks:>16} {server.counts['total']:>10}")
+    print("\nWith the text format every failed answer leaves a blank section that needs a manual re-run of the review;"
+          "\nstructured output re-asks only for the missing fields.")
+
+
+class OfflineReviewer(EmpatheticCodeReviewer):
+    """Answers every LLM request instantly with MOCK_COMPLETION, so only report building is measured"""
+
+    def make_groq_request(self, messages: List[Dict], max_tokens: int = 500, temperature: float = 0.7, **kwargs) -> str:
+        return MOCK_COMPLETION
+
+
+def bench_render(comment_counts: List[int], snippet_lines: int, max_workers: int):
+    """Peak memory of streaming a report to a file with each renderer vs building it with process_review"""
+    import tracemalloc
+    rng = random.Random(13)
+    reviewer = OfflineReviewer(max_workers=max_workers, cache=ResponseCache(bypass=True))
+    names = list(RENDERERS)
+    print(f"peak traced memory in MB while rendering (report size in MB); snippet of {snippet_lines} lines, "
+          f"{max_workers} workers")
+    print(f"{'comments':>9} " + " ".join(f"{name:>16}" for name in names) + f" {'process_review':>16}")
+    with tempfile.TemporaryDirectory() as workdir, open(os.devnull, "w") as devnull:
+        for count in comment_counts:
+            review = synthetic_review(rng, count, snippet_lines)
+            # Anchor comments to lines so each one gets its own excerpt, as in a large real review
+            review["review_comments"] = [{"comment": comment, "lines": [line, line + 2]} for comment, line in
+                                         zip(review["review_comments"], range(1, count * 7, 7))]
+            cells = []
+            with contextlib.redirect_stdout(devnull):
+                for name in names:
+                    renderer = RENDERERS[name]()
+                    path = os.path.join(workdir, "report" + renderer.extension)
+                    with open(path, "w", encoding="utf-8") as sink:
+                        tracemalloc.start()
+                        reviewer.write_review(review, sink, renderer=renderer)
+                        peak = tracemalloc.get_traced_memory()[1]
+                        tracemalloc.stop()
+                    cells.append(f"{peak / 1e6:>7.2f} ({os.path.getsize(path) / 1e6:>5.1f})")
+                tracemalloc.start()
+                report = reviewer.process_review(review)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                cells.append(f"{peak / 1e6:>7.2f} ({len(report.encode()) / 1e6:>5.1f})")
+                del report
+            print(f"{count:>9} " + " ".join(f"{cell:>16}" for cell in cells))
+    print("\nwrite_review keeps only the comments in flight, so its peak stays flat as reviews grow;"
+          "\nprocess_review holds the whole report.")
+
+
+def measure_import(runs: int = 5) -> Tuple[List[float], List[str]]:
+    """Time `import e2` with -X importtime in fresh interpreters; returns the cumulative times
+    in ms and the heavy modules (requests, dotenv, ...) that the import pulled in"""
+    probe = ("import sys, e2; "
+             "print(','.join(m for m in ('requests', 'dotenv', 'httpx', 'sqlite3', 'asyncio') if m in sys.modules))")
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    # Time the import of up-to-date bytecode, not a compile (PYTHONDONTWRITEBYTECODE leaves stale .pyc files)
+    py_compile.compile(os.path.join(cwd, "e2.py"), doraise=True)
+    timings = []
+    eager = ""
+    for _ in range(runs):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", probe],
+                              capture_output=True, text=True, cwd=cwd, check=True)
+        eager = proc.stdout.strip()
+        # Lines look like: "import time:  self [us] | cumulative | imported package"
+        for line in proc.stderr.splitlines():
+            parts = [part.strip() for part in line.split("|")]
+            if len(parts) == 3 and parts[2] == "e2":
+                timings.append(int(parts[1]) / 1000)
+    return timings, eager.split(",") if eager else []
+
+
+def bench_importtime(budget_ms: float, runs: int = 5) -> bool:
+    """Measure `import e2` with -X importtime in fresh interpreters and check it against a budget
+
+    Also asserts that requests and dotenv stay out of sys.modules until the first network call.
+    Returns False (and main exits non-zero) when either check regresses.
+    """
+    timings, eager = measure_import(runs)
+    best = min(timings)
+    print(f"import e2: best {best:.1f} ms, median {percentile(timings, 50):.1f} ms over {runs} runs "
+          f"(budget {budget_ms:.0f} ms)")
+    ok = best <= budget_ms
+    if not ok:
+        print(f"❌ import time regression: {best:.1f} ms > {budget_ms:.0f} ms")
+    if eager:
+        print(f"❌ heavy modules imported eagerly: {', '.join(eager)}")
+        ok = False
+    if ok:
+        print("✅ import budget met; heavy dependencies load lazily")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Empathetic Code Reviewer benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+    matcher = subparsers.add_parser("matcher", help="Keyword matcher scaling microbenchmark")
+    matcher.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    matcher.add_argument("--samples", type=int, default=2000)
+    pipeline = subparsers.add_parser("pipeline", help="End-to-end process_review against a mock LLM server")
+    pipeline.add_argument("--comments", type=int, nargs="+", default=[1, 5, 20])
+    pipeline.add_argument("--snippet-lines", type=int, nargs="+", default=[10, 200])
+    pipeline.add_argument("--reviews", type=int, default=20, help="Reviews per workload")
+    pipeline.add_argument("--concurrency", type=int, default=4, help="Reviews processed at once")
+    pipeline.add_argument("--max-workers", type=int, default=4, help="Concurrent comments per review")
+    pipeline.add_argument("--latency", type=float, default=0.05, help="Mock response time in seconds")
+    pipeline.add_argument("--error-rate", type=float, default=0.0)
+    pipeline.add_argument("--rate-limit-rate", type=float, default=0.0)
+    pipeline.add_argument("--cache", action="store_true", help="Keep the response cache enabled")
+    pipeline.add_argument("--output", default="benchmark_results.json")
+    rules = subparsers.add_parser("rules", help="LLM calls saved by the local rule engine on a review corpus")
+    rules.add_argument("--reviews", type=int, default=200)
+    rules.add_argument("--latency", type=float, default=0.01, help="Mock response time in seconds")
+    processes = subparsers.add_parser("processes", help="Batch throughput: worker threads vs worker processes")
+    processes.add_argument("--counts", type=int, nargs="+", default=[2, 4])
+    processes.add_argument("--jobs", type=int, default=200)
+    processes.add_argument("--comments", type=int, default=10)
+    processes.add_argument("--snippet-lines", type=int, default=300)
+    processes.add_argument("--latency", type=float, default=0.0, help="Mock response time in seconds")
+    batching = subparsers.add_parser("batching", help="Batched prompting vs one request per comment")
+    batching.add_argument("--comments", type=int, nargs="+", default=[3, 5, 10])
+    batching.add_argument("--reviews", type=int, default=20)
+    batching.add_argument("--snippet-lines", type=int, default=40)
+    batching.add_argument("--latency", type=float, default=0.05, help="Mock response time in seconds")
+    batching.add_argument("--max-workers", type=int, default=1, help="Concurrent comments per review")
+    formats = subparsers.add_parser("formats", help="Format failures: labelled text vs structured JSON output")
+    formats.add_argument("--comments", type=int, default=500)
+    formats.add_argument("--drift-rate", type=float, default=0.2, help="Fraction of answers missing a field")
+    formats.add_argument("--latency", type=float, default=0.005, help="Mock response time in seconds")
+    render = subparsers.add_parser("render", help="Memory of streaming reports with each renderer as comments grow")
+    render.add_argument("--comments", type=int, nargs="+", default=[1000, 5000, 10000])
+    render.add_argument("--snippet-lines", type=int, default=2000)
+    render.add_argument("--max-workers", type=int, default=4, help="Concurrent comments per review")
+    importtime = subparsers.add_parser("importtime", help="Import-time regression check for e2")
+    importtime.add_argument("--budget-ms", type=float, default=50.0)
+    importtime.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.benchmark == "matcher":
+        bench_matcher(args.sizes, args.samples)
+    elif args.benchmark == "pipeline":
+        bench_pipeline(args.comments, args.snippet_lines, args.reviews, args.concurrency, args.max_workers,
+                       args.latency, args.error_rate, args.rate_limit_rate, args.output, args.cache)
+    elif args.benchmark == "rules":
+        bench_rules(args.reviews, args.latency)
+    elif args.benchmark == "processes":
+        bench_processes(args.counts, args.jobs, args.comments, args.snippet_lines, args.latency)
+    elif args.benchmark == "batching":
+        bench_batching(args.comments, args.reviews, args.snippet_lines, args.latency, args.max_workers)
+    elif args.benchmark == "formats":
+        bench_formats(args.comments, args.drift_rate, args.latency)
+    elif args.benchmark == "render":
+        bench_render(args.comments, args.snippet_lines, args.max_workers)
+    elif args.benchmark == "importtime":
+        sys.exit(0 if bench_importtime(args.budget_ms, args.runs) else 1)
+
+
+if __name__ == "__main__":
+    main()
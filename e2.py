@@ -1,51 +1,2037 @@
 # Empathetic Code Reviewer using Groq API
 # Secure version – loads API key from .env instead of embedding it
+# Heavy modules (requests, dotenv, asyncio, sqlite3, http.server, ...) are imported where
+# they are first needed so that importing this file stays cheap for CLIs and cold starts.
+
+from __future__ import annotations
 
 import json
-import requests
-from typing import Dict, List
+import hashlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Optional, Set, TextIO, Tuple, Union
 import re
 import time
 import os
-from dotenv import load_dotenv
+import sys
+import random
+import threading
+import contextlib
+import contextvars
+
+if TYPE_CHECKING:  # for annotations only; at runtime these are imported where they are used
+    import ast
+    import asyncio
+    import requests
+
+_environment_loaded = False
+
+
+def load_environment():
+    """Load environment variables from the .env file, once, on first need"""
+    global _environment_loaded
+    if not _environment_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _environment_loaded = True
+
+
+class ConfigurationError(ValueError):
+    """The reviewer cannot reach an LLM because required settings are missing"""
+
+# Status codes worth retrying: rate limiting and transient upstream failures
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+def parse_duration(value: str) -> float:
+    """Parse rate-limit durations such as '7.66s', '2m59.56s', '1h2m' or '250ms' into seconds"""
+    if not value:
+        return 0.0
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    units = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    total = 0.0
+    for amount, unit in re.findall(r'([\d.]+)(ms|h|m|s)', value):
+        total += float(amount) * units[unit]
+    return total
+
+
+class RateLimiter:
+    """Client-side token bucket kept in sync with the provider's rate-limit headers.
+
+    capacity=0 means no client-side budget: requests are only held back by Retry-After
+    pauses until the first x-ratelimit-* headers set one (see unlimited()). Headers can
+    lower the rate but never raise it above the configured one.
+    """
+    
+    def __init__(self, rate: float = 0.5, capacity: int = 30):
+        self.rate = rate  # tokens per second
+        self.max_rate = rate  # the configured rate; 0 when there is none
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+    
+    @classmethod
+    def unlimited(cls) -> RateLimiter:
+        """A limiter with no budget of its own, for endpoints whose limits are not known up front"""
+        return cls(rate=0.0, capacity=0)
+    
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+    
+    def try_acquire(self) -> float:
+        """Take a token if one is available; otherwise return how long to wait before retrying"""
+        with self.lock:
+            now = time.monotonic()
+            if self.capacity <= 0:
+                return 0.0 if now >= self.blocked_until else min(max(self.blocked_until - now, 0.01), 5.0)
+            self._refill(now)
+            if now >= self.blocked_until and self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            wait = max(self.blocked_until - now, (1 - self.tokens) / self.rate if self.rate > 0 else 1.0)
+            return min(max(wait, 0.01), 5.0)
+    
+    def acquire(self):
+        """Block until a request may be sent"""
+        wait = self.try_acquire()
+        while wait:
+            time.sleep(wait)
+            wait = self.try_acquire()
+    
+    async def acquire_async(self):
+        """Wait for a token without blocking the event loop"""
+        import asyncio
+        wait = self.try_acquire()
+        while wait:
+            await asyncio.sleep(wait)
+            wait = self.try_acquire()
+    
+    def pause(self, seconds: float):
+        """Hold every caller back, e.g. after a 429 with Retry-After"""
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+    
+    def update_from_headers(self, headers):
+        """Re-sync the bucket from x-ratelimit-* response headers"""
+        remaining = headers.get("x-ratelimit-remaining-requests")
+        reset = parse_duration(headers.get("x-ratelimit-reset-requests", ""))
+        if remaining is None:
+            return
+        try:
+            remaining = float(remaining)
+        except ValueError:
+            return
+        with self.lock:
+            if self.capacity <= 0:
+                # First headers from an endpoint without a configured budget: adopt the provider's
+                self.capacity = max(remaining, 1.0)
+                self.tokens = remaining
+                self.updated_at = time.monotonic()
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, remaining)
+            if reset > 0:
+                # Spread what is left of the window evenly instead of bursting it. Groq reports the
+                # per-day budget here, so the result may only slow a configured rate down
+                header_rate = max(remaining / reset, 0.01)
+                self.rate = min(header_rate, self.max_rate) if self.max_rate > 0 else header_rate
+
+
+def shared_field(index: int) -> property:
+    return property(lambda self: self.state[index], lambda self, value: self.state.__setitem__(index, value))
+
+
+class SharedRateLimiter(RateLimiter):
+    """RateLimiter whose bucket lives in shared memory, so worker processes draw from one global budget.
+
+    Create it in the parent and hand .state to each worker (e.g. as a process-pool
+    initializer argument); SharedRateLimiter(state=state) there attaches to the same bucket.
+    """
+    
+    rate = shared_field(0)
+    capacity = shared_field(1)
+    tokens = shared_field(2)
+    updated_at = shared_field(3)  # time.monotonic() is system-wide, so processes agree on it
+    blocked_until = shared_field(4)
+    max_rate = shared_field(5)
+    
+    def __init__(self, rate: float = 0.5, capacity: int = 30, state=None):
+        if state is None:
+            import multiprocessing
+            state = multiprocessing.Array("d", [rate, capacity, float(capacity), time.monotonic(), 0.0, rate])
+        self.state = state
+        self.lock = state.get_lock()
+
+
+class DeadlineExceeded(Exception):
+    """The review's time budget ran out before an LLM call could finish"""
+
+
+class Deadline:
+    """Point in time (time.monotonic) by which a review must be answered; seconds=None means no limit"""
+
+    def __init__(self, seconds: float = None):
+        self.expires_at = None if seconds is None else time.monotonic() + seconds
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left, or None when there is no deadline"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def cap(self, timeout: float) -> float:
+        """Shorten a per-operation timeout so it cannot run past the deadline"""
+        remaining = self.remaining()
+        return timeout if remaining is None else max(0.001, min(timeout, remaining))
+
+    def check(self):
+        if self.expired():
+            raise DeadlineExceeded("review deadline exceeded")
+
+    def run(self, func: Callable, *args, **kwargs):
+        """Call func with this deadline applied to every LLM request it makes.
+
+        Meant to be run through ReviewMetrics.track, whose copied context keeps the
+        deadline from leaking to the caller.
+        """
+        CURRENT_DEADLINE.set(self)
+        return func(*args, **kwargs)
+
+
+# Deadline of the review the current call belongs to; requests cap their timeouts to it
+CURRENT_DEADLINE = contextvars.ContextVar("current_deadline", default=None)
+
+
+class BackendError(Exception):
+    """A single attempt against one backend failed"""
+    
+    def __init__(self, message: str, retryable: bool = True, retry_after: float = None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class LLMBackend:
+    """One OpenAI-compatible chat-completions endpoint and model, with live latency/error stats"""
+    
+    def __init__(self, base_url: str, model: str, api_key: str = None, name: str = None,
+                 rate_limiter: RateLimiter = None, smoothing: float = 0.3):
+        self.base_url = base_url
+        self.model = model
+        self.api_key = api_key
+        self.name = name or model
+        # Endpoints other than the default Groq one start without a client-side limit;
+        # their x-ratelimit-* headers and 429 Retry-After pauses drive it instead
+        self.rate_limiter = rate_limiter or RateLimiter.unlimited()
+        self.smoothing = smoothing
+        self.latency = None  # EWMA of successful call latency in seconds
+        self.error_rate = 0.0  # EWMA of failures
+        self.json_schema = True  # cleared once the endpoint rejects a json_schema response_format
+        self.lock = threading.Lock()
+    
+    @property
+    def headers(self) -> Dict[str, str]:
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+    
+    def payload(self, payload: Dict) -> Dict:
+        """payload as sent here: with this backend's model, and JSON mode in place of a
+        json_schema response_format the endpoint has rejected before"""
+        payload = dict(payload, model=self.model)
+        if not self.json_schema and (payload.get("response_format") or {}).get("type") == "json_schema":
+            payload["response_format"] = {"type": "json_object"}
+        return payload
+    
+    def rejected_json_schema(self, payload: Dict, response) -> bool:
+        """Whether the answer (a requests or httpx response) says the endpoint lacks json_schema
+        support: a 400 whose error names the response_format. If so, later payloads use JSON mode instead."""
+        if response.status_code != 400 or (payload.get("response_format") or {}).get("type") != "json_schema":
+            return False
+        if not re.search(r"response_format|json_schema", response.text, re.IGNORECASE):
+            return False  # some other bad request, e.g. too many tokens
+        self.json_schema = False
+        print(f"⚠️ {self.name} rejected the json_schema response_format; using json_object from now on")
+        return True
+    
+    def record(self, success: bool, latency: float):
+        with self.lock:
+            self.error_rate += self.smoothing * ((0.0 if success else 1.0) - self.error_rate)
+            if success:
+                self.latency = latency if self.latency is None else self.latency + self.smoothing * (latency - self.latency)
+    
+    def score(self) -> float:
+        """Expected cost of routing a request here; lower is better, untried backends go first
+        and ones that have only ever failed go last"""
+        with self.lock:
+            if self.latency is None:
+                return 0.0 if self.error_rate == 0 else float("inf")
+            return self.latency * (1 + 10 * self.error_rate)
+
+
+class BackendRouter:
+    """Orders backends by live latency and error rate, skipping ones that are rate limited right now"""
+    
+    def __init__(self, backends: List[LLMBackend]):
+        if not backends:
+            raise ValueError("BackendRouter needs at least one backend")
+        self.backends = list(backends)
+    
+    def ranked(self) -> List[LLMBackend]:
+        # sorted() is stable, so ties keep the configured priority order
+        return sorted(self.backends, key=lambda backend: backend.score())
+    
+    def route(self) -> Iterator[LLMBackend]:
+        """Yield each backend once in failover order, holding a rate-limit token for it"""
+        remaining = self.ranked()
+        while remaining:
+            backend = next((b for b in remaining if b.rate_limiter.try_acquire() == 0), None)
+            if backend is None:
+                backend = remaining[0]
+                backend.rate_limiter.acquire()
+            remaining.remove(backend)
+            yield backend
+    
+    async def route_async(self):
+        remaining = self.ranked()
+        while remaining:
+            backend = next((b for b in remaining if b.rate_limiter.try_acquire() == 0), None)
+            if backend is None:
+                backend = remaining[0]
+                await backend.rate_limiter.acquire_async()
+            remaining.remove(backend)
+            yield backend
+
+
+class SingleFlight:
+    """Collapses concurrent calls that share a key into one execution whose result they all get"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}  # key -> {"done": Event, "result"/"error": ...}
+    
+    def do(self, key: str, func: Callable, *args):
+        """Return (result, shared): shared is True when another caller's execution was reused.
+
+        Callers wait for a shared execution only until their own review deadline, then raise
+        DeadlineExceeded. A None result or DeadlineExceeded from an execution that ran under a
+        deadline is not handed on, since another caller may have time to do better: waiting
+        callers run func again (sharing that run among themselves) instead.
+        """
+        while True:
+            with self.lock:
+                entry = self.calls.get(key)
+                leader = entry is None
+                if leader:
+                    entry = self.calls[key] = {"done": threading.Event(), "deadline": CURRENT_DEADLINE.get()}
+            if leader:
+                break
+            deadline = CURRENT_DEADLINE.get()
+            if not entry["done"].wait(deadline.remaining() if deadline else None):
+                raise DeadlineExceeded("review deadline exceeded waiting for a shared request")
+            if entry["cut_short"]:
+                continue
+            if "error" in entry:
+                raise entry["error"]
+            return entry["result"], True
+        try:
+            entry["result"] = func(*args)
+            return entry["result"], False
+        except Exception as e:
+            entry["error"] = e
+            raise
+        finally:
+            leader_deadline = entry["deadline"]
+            entry["cut_short"] = (leader_deadline is not None and leader_deadline.expires_at is not None and
+                                  (isinstance(entry.get("error"), DeadlineExceeded) or
+                                   ("error" not in entry and entry.get("result") is None)))
+            with self.lock:
+                del self.calls[key]
+            entry["done"].set()
+    
+    def __len__(self) -> int:
+        return len(self.calls)
+
+
+class ResponseCache:
+    """Content-addressed cache of LLM responses: in-memory LRU plus an optional SQLite tier.
+
+    Expired and surplus disk rows are pruned every prune_every writes, so the table may
+    briefly hold up to prune_every rows more than max_disk_entries.
+    """
+    
+    def __init__(self, max_entries: int = 1024, ttl: float = 24 * 3600, path: str = None,
+                 max_disk_entries: int = 100000, bypass: bool = False, prune_every: int = 256):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+        self.prune_every = max(1, prune_every)
+        self.writes_since_prune = 0
+        self.bypass = bypass
+        self.entries = OrderedDict()  # key -> (expires_at, value)
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        self.lock = threading.Lock()
+        self.db = None
+        if path:
+            import sqlite3
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT, created_at REAL)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS responses_created_at ON responses (created_at)")
+            self.db.commit()
+    
+    @staticmethod
+    def make_key(model: str, messages: List[Dict], max_tokens: int, temperature: float) -> str:
+        raw = json.dumps([model, messages, max_tokens, temperature], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    
+    def get(self, key: str) -> Optional[str]:
+        if self.bypass:
+            return None
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > now:
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry[1]
+            if entry:
+                del self.entries[key]
+            if self.db is not None:
+                row = self.db.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+                if row and row[1] + self.ttl > now:
+                    self._remember(key, row[0], row[1] + self.ttl)
+                    self.stats["disk_hits"] += 1
+                    return row[0]
+            self.stats["misses"] += 1
+            return None
+    
+    def set(self, key: str, value: str):
+        if self.bypass:
+            return
+        now = time.time()
+        with self.lock:
+            self._remember(key, value, now + self.ttl)
+            if self.db is not None:
+                self.db.execute("INSERT OR REPLACE INTO responses (key, value, created_at) VALUES (?, ?, ?)",
+                                (key, value, now))
+                self.writes_since_prune += 1
+                if self.writes_since_prune >= self.prune_every:
+                    self._prune(now)
+                self.db.commit()
+    
+    def _prune(self, now: float):
+        # Scans the created_at index, so it runs every prune_every writes rather than on each one
+        self.writes_since_prune = 0
+        self.db.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        self.db.execute("""DELETE FROM responses WHERE key IN (
+            SELECT key FROM responses ORDER BY created_at DESC LIMIT -1 OFFSET ?)""",
+                        (self.max_disk_entries,))
+    
+    def _remember(self, key: str, value: str, expires_at: float):
+        self.entries[key] = (expires_at, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.stats["evictions"] += 1
+    
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            if self.db is not None:
+                self.db.execute("DELETE FROM responses")
+                self.db.commit()
+    
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+
+def comment_identifiers(comment: str) -> Set[str]:
+    """Names a review comment is about: quoted or backticked identifiers and bare one-letter
+    names (not "a", "I" or the letters of contractions such as "don't")"""
+    quoted = re.findall(r"""[`'"]([A-Za-z_][A-Za-z0-9_]*)[`'"]""", comment)
+    letters = re.findall(r"(?<![\w'`\"])([B-HJ-Zb-z_])(?![\w'`\"])", comment)
+    return set(quoted) | set(letters)
+
+
+class FeedbackStore:
+    """Persistent store of past feedback, looked up by similarity of the normalized comment.
+
+    Comments are reduced to sets of content words; MinHash signatures split into LSH
+    bands find candidate entries in SQLite, and the exact Jaccard similarity of the
+    word sets decides whether a stored result is close enough (threshold) to reuse.
+    With match_code=True only feedback given for the same code is reused. Identifiers the
+    comment names ('x', `total`, a bare one-letter name) are kept as `-prefixed words and
+    must match exactly, since the stored feedback is written about those names.
+    """
+    
+    STOPWORDS = {"a", "an", "the", "is", "are", "was", "this", "that", "it", "its", "for", "of", "to", "in",
+                 "on", "and", "or", "be", "here", "very", "too", "so", "just", "really", "please", "you", "your"}
+    PRIME = (1 << 61) - 1
+    
+    def __init__(self, path: str = ":memory:", threshold: float = 0.6, num_perm: int = 64, bands: int = 16,
+                 match_code: bool = True):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.match_code = match_code
+        rng = random.Random(1)  # fixed so signatures stay comparable across runs
+        self.permutations = [(rng.randrange(1, self.PRIME), rng.randrange(0, self.PRIME)) for _ in range(num_perm)]
+        self.stats = {"lookups": 0, "hits": 0, "misses": 0, "stored": 0}
+        self.lock = threading.Lock()
+        import sqlite3
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS feedback (
+                id INTEGER PRIMARY KEY, comment TEXT, tokens TEXT, code_hash TEXT, feedback TEXT, created_at REAL);
+            CREATE TABLE IF NOT EXISTS feedback_bands (band TEXT, feedback_id INTEGER);
+            CREATE INDEX IF NOT EXISTS feedback_bands_band ON feedback_bands (band);
+        """)
+        self.db.commit()
+    
+    def tokens(self, comment: str) -> Set[str]:
+        words = re.findall(r"[a-z_][a-z0-9_]*|==|!=", comment.lower())
+        # Drop filler words; one-letter words only count as identifiers
+        words = {w[:-1] if w.endswith("s") and len(w) > 3 else w
+                 for w in words if w not in self.STOPWORDS and len(w) > 1}
+        return words | {f"`{name}" for name in comment_identifiers(comment)}
+    
+    @staticmethod
+    def named(tokens: Set[str]) -> Set[str]:
+        return {token for token in tokens if token.startswith("`")}
+    
+    def band_keys(self, tokens: Set[str]) -> List[str]:
+        hashes = [int.from_bytes(hashlib.blake2b(t.encode("utf-8"), digest_size=8).digest(), "big") for t in tokens]
+        signature = [min((a * h + b) % self.PRIME for h in hashes) for a, b in self.permutations]
+        return [f"{i}:" + hashlib.blake2b(repr(signature[i * self.rows:(i + 1) * self.rows]).encode(),
+                                         digest_size=8).hexdigest()
+                for i in range(self.bands)]
+    
+    @staticmethod
+    def code_hash(code_snippet: str) -> str:
+        return hashlib.sha256(code_snippet.encode("utf-8")).hexdigest()
+    
+    def lookup(self, comment: str, code_snippet: str) -> Optional[Dict[str, str]]:
+        tokens = self.tokens(comment)
+        with self.lock:
+            self.stats["lookups"] += 1
+            best, best_score = None, 0.0
+            if tokens:
+                keys = self.band_keys(tokens)
+                placeholders = ",".join("?" * len(keys))
+                query = f"""SELECT DISTINCT f.tokens, f.code_hash, f.feedback FROM feedback f
+                            JOIN feedback_bands b ON b.feedback_id = f.id WHERE b.band IN ({placeholders})"""
+                params = list(keys)
+                if self.match_code:
+                    query += " AND f.code_hash = ?"
+                    params.append(self.code_hash(code_snippet))
+                named = self.named(tokens)
+                for stored_tokens, _, feedback in self.db.execute(query, params):
+                    stored = set(json.loads(stored_tokens))
+                    if self.named(stored) != named:
+                        continue
+                    score = len(tokens & stored) / len(tokens | stored)
+                    if score > best_score:
+                        best, best_score = feedback, score
+            if best is None or best_score < self.threshold:
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits"] += 1
+            return json.loads(best)
+    
+    def add(self, comment: str, code_snippet: str, feedback: Dict[str, str]):
+        tokens = self.tokens(comment)
+        if not tokens:
+            return
+        with self.lock:
+            cursor = self.db.execute(
+                "INSERT INTO feedback (comment, tokens, code_hash, feedback, created_at) VALUES (?, ?, ?, ?, ?)",
+                (comment, json.dumps(sorted(tokens)), self.code_hash(code_snippet), json.dumps(feedback), time.time()))
+            self.db.executemany("INSERT INTO feedback_bands (band, feedback_id) VALUES (?, ?)",
+                                [(key, cursor.lastrowid) for key in self.band_keys(tokens)])
+            self.db.commit()
+            self.stats["stored"] += 1
+    
+    def hit_rate(self) -> float:
+        return self.stats["hits"] / self.stats["lookups"] if self.stats["lookups"] else 0.0
+    
+    def close(self):
+        self.db.close()
+
+
+# Per-review totals the current call should be added to (see ReviewMetrics.track)
+CURRENT_REVIEW = contextvars.ContextVar("current_review", default=None)
+
+
+class ReviewMetrics:
+    """Records per-call and per-review timing/token data and forwards each record to exporters.
+
+    An exporter is any callable taking one record dict. Call records carry the stage
+    (feedback, batch, reask or summary), wall time, prompt/completion tokens, retries, and
+    whether the response was cached or fell back to the canned text. Format totals count
+    LLM answers that came back with missing fields and the re-asks spent on them.
+    """
+    
+    def __init__(self, exporters: List[Callable[[Dict], None]] = None):
+        self.exporters = list(exporters or [])
+        self.lock = threading.Lock()
+        self.stages = {}  # stage -> aggregated totals
+        self.reviews = {"count": 0, "wall_time": 0.0, "comments": 0, "degraded": 0}
+        self.local_answers = {}  # LocalRuleEngine rule -> comments it answered
+        self.formats = {"responses": 0, "failures": 0, "missing_fields": 0, "reasks": 0, "wasted_reasks": 0}
+    
+    def add_exporter(self, exporter: Callable[[Dict], None]):
+        self.exporters.append(exporter)
+    
+    @staticmethod
+    def new_review(comment_count: int) -> Dict:
+        return {"type": "review", "comments": comment_count, "calls": 0, "wall_time": 0.0,
+                "prompt_tokens": 0, "completion_tokens": 0, "retries": 0, "fallbacks": 0,
+                "failed_calls": 0, "cache_hits": 0, "degraded": 0, "local_answers": 0, "stage_time": {}}
+    
+    @staticmethod
+    def track(review: Dict, func: Callable, *args, **kwargs):
+        """Run func with its API calls attributed to review, in this thread or a pool worker"""
+        def run():
+            CURRENT_REVIEW.set(review)
+            return func(*args, **kwargs)
+        return contextvars.copy_context().run(run)
+    
+    def record_call(self, record: Dict):
+        record["type"] = "call"
+        with self.lock:
+            totals = self.stages.setdefault(record["stage"], {
+                "calls": 0, "wall_time": 0.0, "prompt_tokens": 0, "completion_tokens": 0,
+                "retries": 0, "fallbacks": 0, "cache_hits": 0, "coalesced": 0, "errors": 0})
+            totals["calls"] += 1
+            totals["wall_time"] += record["wall_time"]
+            totals["prompt_tokens"] += record["prompt_tokens"]
+            totals["completion_tokens"] += record["completion_tokens"]
+            totals["retries"] += record["retries"]
+            totals["fallbacks"] += int(record["fallback"])
+            totals["cache_hits"] += int(record["cached"])
+            totals["coalesced"] += int(record.get("coalesced", False))
+            totals["errors"] += int(bool(record["error"]))
+            
+            review = CURRENT_REVIEW.get()
+            if review is not None:
+                review["calls"] += 1
+                review["prompt_tokens"] += record["prompt_tokens"]
+                review["completion_tokens"] += record["completion_tokens"]
+                review["retries"] += record["retries"]
+                review["fallbacks"] += int(record["fallback"])
+                # Calls the deadline cut short are expected; these are the ones the LLM never answered
+                review["failed_calls"] += int(record["fallback"] and not record.get("deadline"))
+                review["cache_hits"] += int(record["cached"])
+                review["stage_time"][record["stage"]] = review["stage_time"].get(record["stage"], 0.0) + record["wall_time"]
+        self.export(record)
+    
+    def record_local_answer(self, rule: str):
+        """Count a comment answered by a local rule instead of an LLM call"""
+        with self.lock:
+            self.local_answers[rule] = self.local_answers.get(rule, 0) + 1
+            review = CURRENT_REVIEW.get()
+            if review is not None:
+                review["local_answers"] += 1
+    
+    def record_format(self, missing: int, reasked: bool = False, recovered: bool = True):
+        """Count one parsed feedback answer: how many fields it lacked, whether a re-ask
+        was spent on them, and whether that re-ask filled them all"""
+        with self.lock:
+            self.formats["responses"] += 1
+            self.formats["failures"] += int(missing > 0)
+            self.formats["missing_fields"] += missing
+            self.formats["reasks"] += int(reasked)
+            self.formats["wasted_reasks"] += int(reasked and not recovered)
+    
+    def format_failure_rate(self) -> float:
+        with self.lock:
+            return self.formats["failures"] / self.formats["responses"] if self.formats["responses"] else 0.0
+    
+    def record_review(self, review: Dict):
+        with self.lock:
+            self.reviews["count"] += 1
+            self.reviews["wall_time"] += review["wall_time"]
+            self.reviews["comments"] += review["comments"]
+            self.reviews["degraded"] += review["degraded"]
+        self.export(review)
+    
+    def export(self, record: Dict):
+        for exporter in self.exporters:
+            try:
+                exporter(record)
+            except Exception as e:
+                print(f"Metrics exporter failed: {e}")
+    
+    def snapshot(self) -> Dict:
+        with self.lock:
+            return {"stages": {stage: dict(totals) for stage, totals in self.stages.items()},
+                    "reviews": dict(self.reviews), "local_answers": dict(self.local_answers),
+                    "formats": dict(self.formats)}
+    
+    def absorb(self, snapshot: Dict):
+        """Add another ReviewMetrics' snapshot (e.g. from a worker process) to these totals"""
+        with self.lock:
+            for stage, totals in snapshot["stages"].items():
+                mine = self.stages.setdefault(stage, dict.fromkeys(totals, 0))
+                for key, value in totals.items():
+                    mine[key] = mine.get(key, 0) + value
+            for key, value in snapshot["reviews"].items():
+                self.reviews[key] = self.reviews.get(key, 0) + value
+            for rule, count in snapshot["local_answers"].items():
+                self.local_answers[rule] = self.local_answers.get(rule, 0) + count
+            for key, value in snapshot["formats"].items():
+                self.formats[key] += value
+    
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
+    
+    def to_prometheus(self) -> str:
+        """Render the aggregated totals in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines = []
+        stage_metrics = [
+            ("calls", "llm_calls_total", "LLM calls made"),
+            ("wall_time", "llm_call_seconds_total", "Wall time spent in LLM calls"),
+            ("prompt_tokens", "llm_prompt_tokens_total", "Prompt tokens reported by the API"),
+            ("completion_tokens", "llm_completion_tokens_total", "Completion tokens reported by the API"),
+            ("retries", "llm_retries_total", "Retried API attempts"),
+            ("fallbacks", "llm_fallbacks_total", "Calls answered with the canned fallback"),
+            ("cache_hits", "llm_cache_hits_total", "Calls served from the response cache"),
+            ("coalesced", "llm_coalesced_total", "Calls that shared an identical in-flight request"),
+            ("errors", "llm_errors_total", "Calls that ended in an error"),
+        ]
+        for key, name, help_text in stage_metrics:
+            lines.append(f"# HELP empathetic_{name} {help_text}")
+            lines.append(f"# TYPE empathetic_{name} counter")
+            for stage, totals in sorted(snapshot["stages"].items()):
+                lines.append(f'empathetic_{name}{{stage="{stage}"}} {totals[key]}')
+        lines.append("# HELP empathetic_local_rule_answers_total Comments answered by a local rule without an LLM call")
+        lines.append("# TYPE empathetic_local_rule_answers_total counter")
+        for rule, count in sorted(snapshot["local_answers"].items()):
+            lines.append(f'empathetic_local_rule_answers_total{{rule="{rule}"}} {count}')
+        format_metrics = [
+            ("responses", "format_responses_total", "Feedback answers parsed"),
+            ("failures", "format_failures_total", "Feedback answers with at least one missing field"),
+            ("missing_fields", "format_missing_fields_total", "Fields missing from feedback answers"),
+            ("reasks", "format_reasks_total", "Targeted re-asks for missing fields"),
+            ("wasted_reasks", "format_wasted_reasks_total", "Re-asks that still left fields missing"),
+        ]
+        for key, name, help_text in format_metrics:
+            lines.append(f"# HELP empathetic_{name} {help_text}")
+            lines.append(f"# TYPE empathetic_{name} counter")
+            lines.append(f"empathetic_{name} {snapshot['formats'][key]}")
+        review_metrics = [
+            ("count", "reviews_total", "Reviews processed"),
+            ("wall_time", "review_seconds_total", "Wall time spent in process_review"),
+            ("comments", "review_comments_total", "Review comments processed"),
+            ("degraded", "review_degraded_comments_total", "Comments answered locally because the review deadline expired"),
+        ]
+        for key, name, help_text in review_metrics:
+            lines.append(f"# HELP empathetic_{name} {help_text}")
+            lines.append(f"# TYPE empathetic_{name} counter")
+            lines.append(f"empathetic_{name} {snapshot['reviews'][key]}")
+        return "\n".join(lines) + "\n"
+
+
+class KeywordMatcher:
+    """Finds every keyword of a {label: [keywords]} rules table in one pass of a single compiled regex"""
+    
+    def __init__(self, rules: Dict[str, Iterable[str]]):
+        self.labels = {}  # keyword -> labels
+        for label, keywords in rules.items():
+            for keyword in keywords:
+                self.labels.setdefault(keyword.lower(), set()).add(label)
+        keywords = sorted(self.labels)
+        # The regex reports the longest keyword starting at each position, which
+        # implies every shorter keyword that is a prefix of it
+        self.implied = {k: {p for p in keywords if k.startswith(p)} for k in keywords}
+        self.pattern = re.compile(self._trie_regex(keywords)) if keywords else None
+    
+    @staticmethod
+    def _trie_regex(keywords: List[str]) -> str:
+        """Fold the keywords into a prefix trie so matching cost does not grow with the keyword count"""
+        trie = {}
+        for keyword in keywords:
+            node = trie
+            for char in keyword:
+                node = node.setdefault(char, {})
+            node[""] = {}
+        
+        def to_regex(node: Dict) -> str:
+            branches = [re.escape(char) + to_regex(child) for char, child in sorted(node.items()) if char]
+            if not branches:
+                return ""
+            body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+            return f"(?:{body})?" if "" in node else body
+        
+        return to_regex(trie)
+    
+    def find_keywords(self, text: str) -> Set[str]:
+        found = set()
+        if self.pattern is None:
+            return found
+        text = text.lower()
+        match = self.pattern.search(text)
+        while match:
+            found |= self.implied[match.group()]
+            # Resume one character later so overlapping keywords are found too
+            match = self.pattern.search(text, match.start() + 1)
+        return found
+    
+    def find_labels(self, text: str) -> Set[str]:
+        return {label for keyword in self.find_keywords(text) for label in self.labels[keyword]}
+    
+    def score_labels(self, text: str) -> Dict[str, Tuple[int, int]]:
+        """(distinct keywords found, their total length) per label, so labels can be ranked by
+        how many and how specific their hits are"""
+        scores = {}
+        for keyword in self.find_keywords(text):
+            for label in self.labels[keyword]:
+                count, length = scores.get(label, (0, 0))
+                scores[label] = (count + 1, length + len(keyword))
+        return scores
+    
+    def count_labels(self, text: str) -> Dict[str, int]:
+        """Number of distinct keywords found per label"""
+        counts = {}
+        for keyword in self.find_keywords(text):
+            for label in self.labels[keyword]:
+                counts[label] = counts.get(label, 0) + 1
+        return counts
+
 
-# Load environment variables from .env file
-load_dotenv()
+class SnippetContext:
+    """A review's code snippet parsed once: an outline of its functions/classes and
+    compact per-line-range excerpts to send instead of the whole file"""
+    
+    def __init__(self, code_snippet: str, max_prompt_lines: int = 300, max_excerpt_lines: int = 80,
+                 context_lines: int = 5):
+        self.code_snippet = code_snippet
+        self.lines = code_snippet.splitlines()
+        self.max_prompt_lines = max_prompt_lines
+        self.max_excerpt_lines = max_excerpt_lines
+        self.context_lines = context_lines
+        self.scopes = []  # (start, end, depth, signature) for every def/class
+        import ast
+        try:
+            self._collect_scopes(ast.parse(code_snippet), 0)
+        except (SyntaxError, ValueError):
+            pass  # not valid Python: fall back to plain line windows
+    
+    def _collect_scopes(self, node: ast.AST, depth: int):
+        import ast
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                start = min([d.lineno for d in child.decorator_list] + [child.lineno])
+                signature = self.lines[child.lineno - 1].strip()
+                self.scopes.append((start, child.end_lineno, depth, signature))
+                self._collect_scopes(child, depth + 1)
+            else:
+                self._collect_scopes(child, depth)
+    
+    def outline(self, max_entries: int = None) -> str:
+        scopes = sorted(self.scopes)
+        lines = [f"# {'    ' * depth}L{start}-{end}: {signature}"
+                 for start, end, depth, signature in scopes[:max_entries]]
+        if max_entries is not None and len(scopes) > max_entries:
+            lines.append(f"# ... {len(scopes) - max_entries} more definitions")
+        return "\n".join(lines)
+    
+    def clamp(self, line_range: Optional[Tuple[int, int]]) -> Optional[Tuple[int, int]]:
+        """line_range in order and cut to the file, or None when it lies wholly outside it"""
+        if line_range is None:
+            return None
+        start, end = sorted(line_range)
+        if end < 1 or start > len(self.lines):
+            return None
+        return max(1, start), min(len(self.lines), end)
+    
+    def excerpt(self, start: int, end: int) -> Tuple[int, int]:
+        """Lines to show for a comment on start-end: the innermost enclosing def/class if it is
+        small enough, otherwise the range plus a few lines of context. A range outside the file
+        gets the opening window instead."""
+        line_range = self.clamp((start, end))
+        if line_range is None:
+            return self.window()
+        start, end = line_range
+        enclosing = [(s_end - s_start, s_start, s_end) for s_start, s_end, _, _ in self.scopes
+                     if s_start <= start and end <= s_end and s_end - s_start < self.max_excerpt_lines]
+        if enclosing:
+            _, start, end = min(enclosing)
+            return start, end
+        return max(1, start - self.context_lines), min(len(self.lines), end + self.context_lines)
+    
+    def window(self, line_range: Tuple[int, int] = None) -> Tuple[int, int]:
+        """First and last line prompt_code shows for line_range"""
+        if line_range is None:
+            return 1, min(len(self.lines), self.max_prompt_lines)
+        return self.excerpt(*line_range)
+    
+    def render(self, start: int, end: int) -> str:
+        return "\n".join([f"# Lines {start}-{end} of {len(self.lines)}"] + self.lines[start - 1:end])
+    
+    def outline_note(self, windows: List[Tuple[int, int]]) -> str:
+        """The outline to append when any of the windows leaves part of the file out, else ''"""
+        if self.scopes and any(start > 1 or end < len(self.lines) for start, end in windows):
+            return "\n\n# Outline of the full file:\n" + self.outline(self.max_excerpt_lines)
+        return ""
+    
+    @staticmethod
+    def strip_prompt_code(code: str) -> str:
+        """The code lines of a prompt_code excerpt, without its "# Lines a-b of N" header and outline"""
+        header = re.match(r"# Lines \d+-\d+ of \d+\n", code)
+        if header:
+            code = code[header.end():]
+            outline_start = code.rfind("\n\n# Outline of the full file:\n")
+            if outline_start != -1:
+                code = code[:outline_start]
+        return code
+    
+    def prompt_code(self, line_range: Tuple[int, int] = None) -> str:
+        """Code to embed in a prompt: the whole snippet when it is small enough,
+        otherwise a relevant window plus the file outline"""
+        line_range = self.clamp(line_range)
+        if line_range is None and len(self.lines) <= self.max_prompt_lines:
+            return self.code_snippet
+        start, end = self.window(line_range)
+        return self.render(start, end) + self.outline_note([(start, end)])
+    
+    def batch_prompt_code(self, line_ranges: List[Optional[Tuple[int, int]]]) -> Tuple[List[str], str]:
+        """Code for several comments sent in one prompt: each comment's excerpt, with overlapping
+        windows merged so shared lines are sent once, and the outline to send once beside them.
+        An excerpt plus the outline is what prompt_code shows for that comment alone."""
+        if len(self.lines) <= self.max_prompt_lines:
+            return [self.code_snippet] * len(line_ranges), ""
+        windows = [self.window(line_range) for line_range in line_ranges]
+        merged = []
+        for start, end in sorted(set(windows)):
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        codes = {}
+        for start, end in windows:
+            if (start, end) not in codes:
+                m_start, m_end = next(window for window in merged if window[0] <= start and end <= window[1])
+                codes[start, end] = self.render(m_start, m_end)
+        return [codes[window] for window in windows], self.outline_note([tuple(window) for window in merged])
+
+
+# Heuristic rules tables: extend these instead of adding branches to the methods below
+SEVERITY_RULES = {
+    "harsh": ['bad', 'wrong', 'terrible', 'awful', 'stupid', 'inefficient', 'horrible', 'trash'],
+    "moderate": ['could be better', 'consider', 'might want', 'should', 'redundant'],
+}
+
+EXPERIENCE_RULES = {
+    "beginner": ['== True', '== False', 'results = []', 'append(', 'range(len('],
+    "intermediate": ['comprehension', 'lambda', 'yield', 'enumerate', 'zip'],
+}
+
+# language -> ordered topics, each with trigger keywords and the links it adds
+RESOURCE_RULES = {
+    "python": [
+        {
+            "topic": "naming",
+            "keywords": ["variable", "name"],
+            "resources": [
+                "https://pep8.org/#naming-conventions",
+                "https://realpython.com/python-pep8/#naming-conventions"
+            ]
+        },
+        {
+            "topic": "booleans",
+            "keywords": ["boolean", "== true", "redundant"],
+            "resources": [
+                "https://pep8.org/#programming-recommendations",
+                "https://docs.python.org/3/tutorial/datastructures.html#more-on-conditions"
+            ]
+        },
+        {
+            "topic": "loops",
+            "keywords": ["inefficient", "performance", "loop"],
+            "resources": [
+                "https://docs.python.org/3/tutorial/datastructures.html#list-comprehensions",
+                "https://realpython.com/list-comprehension-python/"
+            ]
+        },
+    ],
+}
+
+
+# Review issues answered locally from the code's AST: a rule applies when the comment mentions
+# one of its keywords and LocalRuleEngine.find_<rule> confirms the pattern is in the code.
+# Keywords should name the issue, not words ordinary prose uses too; when several rules match,
+# the one with the most (then the longest) keyword hits is tried first.
+# {subject} is filled in from what was found.
+LOCAL_RULES = [
+    {
+        "rule": "boolean_comparison",
+        "keywords": ["== true", "== false", "!= true", "!= false",
+                     "boolean comparison", "compare to true", "compare to false", "comparison to true",
+                     "comparison to false", "comparing to true", "comparing to false", "redundant comparison"],
+        "rephrasing": {
+            "beginner": "Nice, readable condition! You can make it even simpler by using {subject} directly instead of comparing with True or False.",
+            "intermediate": "The logic is right; {subject} can be used directly as the condition instead of being compared with True or False.",
+        },
+        "why": "A boolean is already True or False, so comparing it again adds noise without changing the result. PEP 8 recommends `if flag:` over `if flag == True:`, and the shorter form reads like plain English.",
+    },
+    {
+        "rule": "range_len",
+        "keywords": ["range(len", "enumerate", "index-based", "indexing", "loop over indices", "iterate directly"],
+        "rephrasing": {
+            "beginner": "Good job getting the loop working! Python lets you loop over {subject} directly, so you don't need to manage the index yourself.",
+            "intermediate": "The loop is correct; iterating over {subject} directly (or with enumerate when the index is needed) is the more idiomatic form.",
+        },
+        "why": "`for item in items` says what the loop is about and removes a whole class of off-by-one and wrong-index mistakes. When the position is needed too, `enumerate` hands you both without calling `len` or indexing.",
+    },
+    {
+        "rule": "append_loop",
+        "keywords": [".append", "append loop", "comprehension", "loop twice", "build the list", "building a list", "building the list"],
+        "rephrasing": {
+            "beginner": "You built {subject} step by step, which is a great way to start! A list comprehension can express the same thing in a single, clear line.",
+            "intermediate": "Building {subject} with an append loop works; a list comprehension states the intent more directly and is a little faster.",
+        },
+        "why": "A list comprehension shows the whole transformation - source, filter and result - in one place, avoids the empty-list-then-append boilerplate, and runs faster because it skips the repeated `.append` lookups.",
+    },
+    {
+        "rule": "single_letter_name",
+        "keywords": ["bad name", "variable name", "poorly named", "single-letter", "single letter", "one-letter",
+                     "descriptive name", "unclear name", "meaningful name", "rename"],
+        "rephrasing": {
+            "beginner": "Nice work on the logic! Giving {subject} a more descriptive name will make it even easier for others (and future you) to follow.",
+            "intermediate": "The code is clear once you know what {subject} holds; a descriptive name makes that obvious at first read.",
+        },
+        "why": "Names are the first documentation a reader sees. A descriptive name tells them what each value is without tracing where it came from, which makes reviews, debugging and later changes faster.",
+    },
+]
+
+
+class LocalRuleEngine:
+    """Answers common Python review comments from the code's AST in microseconds, without an LLM call.
+
+    A rule is used only when the comment mentions it and the pattern is really in the code;
+    anything else returns None and is left to the LLM. Improved code is produced by
+    rewriting the AST (needs ast.unparse, Python 3.9+; on 3.8 every comment goes to the LLM).
+    Only the statements a fix changes are regenerated; the rest of the code, comments
+    included, is kept as written (see splice).
+    """
+    
+    def __init__(self, rules: List[Dict] = None, max_cached_trees: int = 64):
+        self.rules = list(rules or LOCAL_RULES)
+        self.matcher = KeywordMatcher({rule["rule"]: rule["keywords"] for rule in self.rules})
+        self.max_cached_trees = max_cached_trees
+        self.trees = OrderedDict()  # code -> (dedented source, all AST nodes, {fix key: improved code}) or None, LRU order
+        self.lock = threading.Lock()
+        self.stats = {"lookups": 0, "hits": 0}
+    
+    def answer(self, code_snippet: str, comment: str, experience_level: str = "beginner") -> Optional[Dict[str, str]]:
+        """Feedback for the comment if a rule covers it, else None"""
+        import ast
+        with self.lock:
+            self.stats["lookups"] += 1
+        scores = self.matcher.score_labels(comment)
+        if not scores or not hasattr(ast, "unparse"):
+            return None
+        parsed = self.parse(code_snippet)
+        if parsed is None:
+            return None
+        source, nodes, fixes = parsed
+        # sorted() is stable, so rules scoring alike keep their table order
+        for rule in sorted((rule for rule in self.rules if rule["rule"] in scores),
+                           key=lambda rule: scores[rule["rule"]], reverse=True):
+            finding = getattr(self, f"find_{rule['rule']}")(nodes, comment)
+            if not finding:
+                continue
+            # Fixers mutate the tree they get, so they work on a fresh parse; results are reused
+            fix_key = (rule["rule"], repr(sorted(finding.items())))
+            if fix_key not in fixes:
+                improved = getattr(self, f"fix_{rule['rule']}")(ast.parse(source), finding)
+                fixes[fix_key] = self.splice(source, nodes[0], ast.fix_missing_locations(improved))
+            with self.lock:
+                self.stats["hits"] += 1
+            return {
+                "positive_rephrasing": rule["rephrasing"].get(experience_level, rule["rephrasing"]["beginner"]).format(**finding),
+                "why_explanation": rule["why"],
+                "code_improvement": fixes[fix_key],
+                "local_rule": rule["rule"],
+            }
+        return None
+    
+    def hit_rate(self) -> float:
+        return self.stats["hits"] / self.stats["lookups"] if self.stats["lookups"] else 0.0
+    
+    def parse(self, code_snippet: str):
+        """Parse and walk once per distinct snippet, so each rule only scans a flat node list.
+        The header and outline of a prompt_code excerpt are dropped so an indented excerpt can be dedented."""
+        with self.lock:
+            if code_snippet in self.trees:
+                self.trees.move_to_end(code_snippet)
+                return self.trees[code_snippet]
+        import ast
+        import textwrap
+        source = textwrap.dedent("\n".join(SnippetContext.strip_prompt_code(code_snippet).splitlines()))
+        try:
+            parsed = source, list(ast.walk(ast.parse(source))), {}
+        except (SyntaxError, ValueError):
+            parsed = None
+        with self.lock:
+            self.trees[code_snippet] = parsed
+            while len(self.trees) > self.max_cached_trees:
+                self.trees.popitem(last=False)
+        return parsed
+    
+    @staticmethod
+    def splice(source: str, original, improved) -> str:
+        """source with only the statements that differ between the original and improved trees
+        regenerated, so comments and formatting elsewhere are kept; the whole improved tree
+        unparsed when a change cannot be placed on whole lines (e.g. `a = 1; b = 2`)"""
+        import ast
+        import copy
+        lines = source.split("\n")
+        edits = []  # (first line, last line, replacement lines), 1-based and inclusive
+        block_fields = ("body", "orelse", "finalbody", "handlers")
+        
+        def text_at(line: int, start: int = 0, end: int = None) -> str:
+            return lines[line - 1].encode()[start:end].decode(errors="replace")  # AST columns count UTF-8 bytes
+        
+        def first_line(node) -> int:
+            return min([node.lineno] + [decorator.lineno for decorator in getattr(node, "decorator_list", [])])
+        
+        def place(node, last: int, new_lines: List[str], comment: Optional[str]):
+            """Replace the lines from node's first to last with new_lines, indented like node"""
+            indent = text_at(node.lineno, 0, node.col_offset)
+            if indent.strip():
+                raise ValueError("statement does not start its line")
+            if isinstance(node, ast.If) and text_at(node.lineno, node.col_offset).startswith("elif") and new_lines:
+                new_lines[0] = "el" + new_lines[0]  # an `elif` is an If nested in the orelse
+            new_lines = [indent + line for line in new_lines]
+            if comment and new_lines:
+                new_lines[-1] += "  " + comment
+            edits.append((first_line(node), last, new_lines))
+        
+        def replace(old: List, new: List):
+            """Regenerate the consecutive statements old as new"""
+            tail = re.match(r"\s*(#.*)?$", text_at(old[-1].end_lineno, old[-1].end_col_offset))
+            if not tail:
+                raise ValueError("statement does not end its line")
+            place(old[0], old[-1].end_lineno,
+                  [line for statement in new for line in ast.unparse(statement).split("\n")], tail.group(1))
+        
+        def replace_header(old, new):
+            """Regenerate only the `if ...:` / `for ...:` / `def ...:` lines of a compound statement"""
+            end = (old.lineno, old.col_offset)  # where the last expression of the header ends
+            for field in set(old._fields) - set(block_fields):
+                value = getattr(old, field)
+                for item in value if isinstance(value, list) else [value]:
+                    for node in ast.walk(item) if isinstance(item, ast.AST) else ():
+                        if getattr(node, "end_lineno", None):
+                            end = max(end, (node.end_lineno, node.end_col_offset))
+            closing = re.match(r"[\s)\]]*(?:->[^:]*)?:\s*(#.*)?$", text_at(*end))
+            if not closing or end[0] >= old.body[0].lineno:
+                raise ValueError("header shares its lines with other code")
+            header_only = copy.copy(new)
+            for field in block_fields:
+                if hasattr(header_only, field):
+                    setattr(header_only, field, [])
+            header_only.body = [ast.Pass()]
+            place(old, end[0], ast.unparse(header_only).split("\n")[:-1], closing.group(1))  # minus the `pass`
+        
+        def dump(value):
+            if isinstance(value, list):
+                return [dump(item) for item in value]
+            return ast.dump(value) if isinstance(value, ast.AST) else value
+        
+        def compare(old, new):
+            if ast.dump(old) == ast.dump(new):
+                return
+            if type(old) is not type(new) or not getattr(old, "body", None) or not getattr(new, "body", None):
+                replace([old], [new])
+                return
+            blocks = [field for field in block_fields if getattr(old, field, None) and getattr(new, field, None)]
+            changed = {field for field in old._fields
+                       if field not in blocks and dump(getattr(old, field)) != dump(getattr(new, field, None))}
+            if changed & set(block_fields):
+                replace([old], [new])  # a block was added or removed
+                return
+            if changed:
+                try:
+                    replace_header(old, new)
+                except ValueError:
+                    replace([old], [new])  # e.g. `if x == True: return x` on one line
+                    return
+            for field in blocks:
+                compare_blocks(getattr(old, field), getattr(new, field))
+        
+        def compare_blocks(old: List, new: List):
+            if len(old) == len(new):
+                for old_statement, new_statement in zip(old, new):
+                    compare(old_statement, new_statement)
+                return
+            same = lambda a, b: ast.dump(a) == ast.dump(b)
+            prefix = 0
+            while prefix < min(len(old), len(new)) and same(old[prefix], new[prefix]):
+                prefix += 1
+            suffix = 0
+            while (suffix < min(len(old), len(new)) - prefix
+                   and same(old[len(old) - 1 - suffix], new[len(new) - 1 - suffix])):
+                suffix += 1
+            if prefix == len(old) - suffix:
+                raise ValueError("statements inserted without one to replace")
+            replace(old[prefix:len(old) - suffix], new[prefix:len(new) - suffix])
+        
+        try:
+            compare_blocks(original.body, improved.body)
+        except ValueError:
+            return ast.unparse(improved)
+        for first, last, new_lines in sorted(edits, reverse=True):
+            lines[first - 1:last] = new_lines
+        return "\n".join(lines)
+    
+    @staticmethod
+    def singular(node) -> Optional[str]:
+        """`users` / `self.users` -> `user`; None when the name does not look plural"""
+        import ast
+        name = node.attr if isinstance(node, ast.Attribute) else getattr(node, "id", "")
+        if len(name) > 3 and name.endswith("ies"):
+            return name[:-3] + "y"
+        if len(name) > 1 and name.endswith("s") and not name.endswith("ss"):
+            return name[:-1]
+        return None
+    
+    @staticmethod
+    def names_in(nodes: List) -> Set[str]:
+        import ast
+        names = {node.id for node in nodes if isinstance(node, ast.Name)}
+        return names | {node.arg for node in nodes if isinstance(node, ast.arg)}
+    
+    @staticmethod
+    def bool_comparison(node) -> Optional[bool]:
+        """For `x == True`, `x is False`, `x != True`...: whether the test is equivalent to `x`
+        (True) or to `not x` (False); None for any other node"""
+        import ast
+        if not (isinstance(node, ast.Compare) and len(node.ops) == 1
+                and isinstance(node.ops[0], (ast.Eq, ast.NotEq, ast.Is, ast.IsNot))):
+            return None
+        right = node.comparators[0]
+        if not (isinstance(right, ast.Constant) and isinstance(right.value, bool)):
+            return None
+        return (isinstance(node.ops[0], (ast.Eq, ast.Is))) == right.value
+    
+    def find_boolean_comparison(self, nodes: List, comment: str) -> Optional[Dict]:
+        import ast
+        found = [node for node in nodes if self.bool_comparison(node) is not None]
+        if not found:
+            return None
+        return {"subject": " and ".join(f"`{ast.unparse(node.left)}`" for node in found[:3])}
+    
+    def fix_boolean_comparison(self, tree, finding: Dict):
+        import ast
+        engine = self
+        
+        class Simplify(ast.NodeTransformer):
+            def visit_Compare(self, node):
+                self.generic_visit(node)
+                positive = engine.bool_comparison(node)
+                if positive is None:
+                    return node
+                return node.left if positive else ast.UnaryOp(op=ast.Not(), operand=node.left)
+        
+        return Simplify().visit(tree)
+    
+    @staticmethod
+    def range_len_sequence(node):
+        """The sequence of a `for i in range(len(seq))` loop that only reads seq[i], else None"""
+        import ast
+        call = node.iter if isinstance(node, ast.For) else None
+        if not (isinstance(call, ast.Call) and isinstance(call.func, ast.Name) and call.func.id == "range"
+                and len(call.args) == 1 and not call.keywords and isinstance(node.target, ast.Name)):
+            return None
+        inner = call.args[0]
+        if not (isinstance(inner, ast.Call) and isinstance(inner.func, ast.Name) and inner.func.id == "len"
+                and len(inner.args) == 1 and isinstance(inner.args[0], (ast.Name, ast.Attribute))):
+            return None
+        sequence = inner.args[0]
+        # Loops that assign to seq[i] are left alone: an item variable would go stale after the write
+        sequence_dump = ast.dump(sequence)
+        for statement in node.body:
+            for child in ast.walk(statement):
+                if (isinstance(child, ast.Subscript) and not isinstance(child.ctx, ast.Load)
+                        and ast.dump(child.value) == sequence_dump):
+                    return None
+        return sequence
+    
+    def find_range_len(self, nodes: List, comment: str) -> Optional[Dict]:
+        import ast
+        loops = [node for node in nodes if self.range_len_sequence(node) is not None]
+        if not loops:
+            return None
+        return {"subject": " and ".join(f"`{ast.unparse(self.range_len_sequence(loop))}`" for loop in loops[:3])}
+    
+    def fix_range_len(self, tree, finding: Dict):
+        import ast
+        nodes = list(ast.walk(tree))
+        taken = self.names_in(nodes)
+        for loop in [node for node in nodes if self.range_len_sequence(node) is not None]:
+            sequence = self.range_len_sequence(loop)
+            index = loop.target.id
+            item = self.singular(sequence) or "item"
+            if item in taken:
+                item = f"{item}_item" if f"{item}_item" not in taken else None
+            if item is None:
+                continue
+            taken.add(item)
+            sequence_dump = ast.dump(sequence)
+            
+            class ReplaceIndexing(ast.NodeTransformer):
+                def visit_Subscript(self, node):
+                    self.generic_visit(node)
+                    if (isinstance(node.ctx, ast.Load) and isinstance(node.slice, ast.Name)
+                            and node.slice.id == index and ast.dump(node.value) == sequence_dump):
+                        return ast.Name(id=item, ctx=ast.Load())
+                    return node
+            
+            loop.body = [ReplaceIndexing().visit(statement) for statement in loop.body]
+            index_used = any(isinstance(node, ast.Name) and node.id == index
+                             for statement in loop.body for node in ast.walk(statement))
+            if index_used:
+                loop.target = ast.Tuple(elts=[ast.Name(id=index, ctx=ast.Store()), ast.Name(id=item, ctx=ast.Store())],
+                                        ctx=ast.Store())
+                loop.iter = ast.Call(func=ast.Name(id="enumerate", ctx=ast.Load()), args=[sequence], keywords=[])
+            else:
+                loop.target = ast.Name(id=item, ctx=ast.Store())
+                loop.iter = sequence
+        return tree
+    
+    @staticmethod
+    def append_loops(nodes: Iterable) -> List[Tuple[List, int, str]]:
+        """Every `name = []` directly followed by a for loop whose body is only
+        `name.append(x)` (optionally under one `if`): (statement list, index, name).
+        Loops whose variable is read after the loop are left out: a comprehension would not bind it."""
+        import ast
+        nodes = list(nodes)
+        loads = [(getattr(node, "lineno", 0), getattr(node, "col_offset", 0), node.id) for node in nodes
+                 if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load)]
+        found = []
+        for parent in nodes:
+            for field in ("body", "orelse", "finalbody"):
+                statements = getattr(parent, field, None)
+                if not isinstance(statements, list):
+                    continue
+                for i, (first, loop) in enumerate(zip(statements, statements[1:])):
+                    if not (isinstance(first, ast.Assign) and len(first.targets) == 1
+                            and isinstance(first.targets[0], ast.Name) and isinstance(first.value, ast.List)
+                            and not first.value.elts and isinstance(loop, ast.For) and not loop.orelse
+                            and len(loop.body) == 1):
+                        continue
+                    targets = {node.id for node in ast.walk(loop.target) if isinstance(node, ast.Name)}
+                    loop_end = (getattr(loop, "end_lineno", 0), getattr(loop, "end_col_offset", 0))
+                    if any(name in targets and (line, column) >= loop_end for line, column, name in loads):
+                        continue
+                    body = loop.body[0]
+                    if isinstance(body, ast.If) and not body.orelse and len(body.body) == 1:
+                        body = body.body[0]
+                    name = first.targets[0].id
+                    if (isinstance(body, ast.Expr) and isinstance(body.value, ast.Call)
+                            and isinstance(body.value.func, ast.Attribute) and body.value.func.attr == "append"
+                            and isinstance(body.value.func.value, ast.Name) and body.value.func.value.id == name
+                            and len(body.value.args) == 1 and not body.value.keywords):
+                        found.append((statements, i, name))
+        return found
+    
+    def find_append_loop(self, nodes: List, comment: str) -> Optional[Dict]:
+        loops = self.append_loops(nodes)
+        if not loops:
+            return None
+        return {"subject": " and ".join(f"`{name}`" for _, _, name in loops[:3])}
+    
+    def fix_append_loop(self, tree, finding: Dict):
+        import ast
+        # Rewrite from the end so earlier indices in the same statement list stay valid
+        for statements, i, name in reversed(self.append_loops(ast.walk(tree))):
+            loop = statements[i + 1]
+            body = loop.body[0]
+            conditions = []
+            if isinstance(body, ast.If):
+                conditions.append(body.test)
+                body = body.body[0]
+            comprehension = ast.ListComp(
+                elt=body.value.args[0],
+                generators=[ast.comprehension(target=loop.target, iter=loop.iter, ifs=conditions, is_async=0)])
+            statements[i:i + 2] = [ast.Assign(targets=[ast.Name(id=name, ctx=ast.Store())], value=comprehension,
+                                              lineno=statements[i].lineno)]
+        return tree
+    
+    def find_single_letter_name(self, nodes: List, comment: str) -> Optional[Dict]:
+        import ast
+        named = comment_identifiers(comment)
+        sources = {}  # single-letter name -> the iterable it is bound from, if any
+        for node in nodes:
+            if isinstance(node, (ast.For, ast.comprehension)) and isinstance(node.target, ast.Name):
+                sources.setdefault(node.target.id, node.iter)
+            elif isinstance(node, ast.arg):
+                sources.setdefault(node.arg, None)
+            elif isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+                sources.setdefault(node.id, None)
+        candidates = [name for name in sources if len(name) == 1 and name not in "_ijk"]
+        if named:
+            candidates = [name for name in candidates if name in named]
+            if (named & set(sources)) - set(candidates):
+                return None  # the comment is about a name this rule cannot improve
+        taken = self.names_in(nodes)
+        renames = {}
+        for name in candidates:
+            new_name = self.singular(sources[name]) if sources[name] is not None else None
+            if not new_name or new_name in taken:
+                return None
+            renames[name] = new_name
+            taken.add(new_name)
+        if not renames:
+            return None
+        return {"subject": " and ".join(f"`{old}`" for old in renames), "renames": renames}
+    
+    def fix_single_letter_name(self, tree, finding: Dict):
+        import ast
+        renames = finding["renames"]
+        
+        class Rename(ast.NodeTransformer):
+            def visit_Name(self, node):
+                node.id = renames.get(node.id, node.id)
+                return node
+            
+            def visit_arg(self, node):
+                node.arg = renames.get(node.arg, node.arg)
+                return node
+        
+        return Rename().visit(tree)
+
+
+class FeedbackTally:
+    """Running counts the review summary needs, so a review does not keep every comment's feedback"""
+    
+    def __init__(self, feedback_items: Iterable[Dict] = ()):
+        self.count = 0
+        self.harsh = 0
+        self.degraded = 0
+        for feedback in feedback_items:
+            self.add(feedback)
+    
+    @classmethod
+    def of(cls, feedback_items: Union[Iterable[Dict], FeedbackTally]) -> FeedbackTally:
+        return feedback_items if isinstance(feedback_items, cls) else cls(feedback_items)
+    
+    def add(self, feedback: Dict):
+        self.count += 1
+        self.harsh += feedback.get("severity") == "harsh"
+        self.degraded += bool(feedback.get("degraded"))
+
+
+class ReportRenderer(ABC):
+    """Writes one review report to a file-like sink piece by piece while the review runs.
+    
+    render() feeds it the events of EmpatheticCodeReviewer.iter_feedback: start(sink, review)
+    once, comment(sink, item) for each comment in order, then finish(sink, summary). A renderer
+    keeps only the state its format needs between calls, never the document written so far.
+    """
+    name = None
+    extension = ".txt"
+    SEVERITY_EMOJI = {"harsh": "🤗", "moderate": "💪", "neutral": "✨"}
+    DEGRADED_NOTE = "the review deadline expired before the AI answered, so this section uses local guidance."
+    
+    def __init__(self, max_report_lines: int = 300):
+        # Longer snippets are summarized by their outline instead of echoed in full
+        self.max_report_lines = max_report_lines
+    
+    def render(self, events: Iterable[Tuple[str, object]], sink: TextIO):
+        handlers = {"start": self.start, "comment": self.comment, "finish": self.finish}
+        for kind, data in events:
+            handlers[kind](sink, data)
+            sink.flush()
+    
+    @abstractmethod
+    def start(self, sink: TextIO, review: Dict):
+        """Write the header: title, code (or its outline) and experience level"""
+    
+    @abstractmethod
+    def comment(self, sink: TextIO, item: Dict):
+        """Write the section of one comment"""
+    
+    @abstractmethod
+    def finish(self, sink: TextIO, summary: str):
+        """Write the summary and close the document"""
+    
+    def outline(self, review: Dict) -> Optional[str]:
+        """What to show instead of the code when the snippet is too long to repeat, else None"""
+        context = review["context"]
+        if len(context.lines) <= self.max_report_lines:
+            return None
+        return context.outline() or "\n".join(context.lines[:self.max_report_lines])
+    
+    @staticmethod
+    def location(line_range: Optional[Tuple[int, int]]) -> str:
+        if not line_range:
+            return ""
+        if line_range[0] == line_range[1]:
+            return f"line {line_range[0]}"
+        return f"lines {line_range[0]}-{line_range[1]}"
+
+
+class MarkdownRenderer(ReportRenderer):
+    """The markdown report process_review returns"""
+    name = "markdown"
+    extension = ".md"
+    
+    def start(self, sink: TextIO, review: Dict):
+        sink.write(self.header(review))
+    
+    def comment(self, sink: TextIO, item: Dict):
+        sink.write("\n")
+        for part in self.section_parts(item):
+            sink.write(part)
+    
+    def finish(self, sink: TextIO, summary: str):
+        sink.write("\n" + self.footer(summary))
+    
+    def header(self, review: Dict) -> str:
+        outline = self.outline(review)
+        if outline is not None:
+            return '\n'.join([
+                "# 🤝 Empathetic Code Review Report",
+                "",
+                f"**Original Code:** {len(review['context'].lines)} lines (outline below; each comment shows its own excerpt to the reviewer)",
+                "```python",
+                outline,
+                "```",
+                ""
+            ])
+        return '\n'.join([
+            "# 🤝 Empathetic Code Review Report",
+            "",
+            "**Original Code:**",
+            "```python",
+            review["code_snippet"],
+            "```",
+            ""
+        ])
+    
+    def section(self, item: Dict) -> str:
+        return "".join(self.section_parts(item))
+    
+    def section_parts(self, item: Dict) -> Iterator[str]:
+        feedback = item["feedback"]
+        emoji = self.SEVERITY_EMOJI.get(feedback.get("severity"), "✨")
+        location = self.location(item["line_range"])
+        location = f" ({location})" if location else ""
+        degraded = f"\n> ⏱️ **Degraded:** {self.DEGRADED_NOTE}\n" if feedback.get("degraded") else ""
+        
+        yield f"""---
+
+### {emoji} Analysis of Comment {item['index']}: "{item['comment']}"{location}
+{degraded}
+**🌟 Positive Rephrasing:** {feedback['positive_rephrasing']}
+
+**🧠 The 'Why':** {feedback['why_explanation']}
+
+**💡 Suggested Improvement:**
+```python
+{feedback['code_improvement']}
+```"""
+        if item["resources"]:
+            yield "\n\n**📚 Helpful Resources:**\n"
+            for resource in item["resources"]:
+                yield f"- [{resource}]({resource})\n"
+    
+    def footer(self, summary: str) -> str:
+        return '\n'.join([
+            "\n---\n",
+            "## 🎯 Overall Summary",
+            "",
+            summary,
+            "",
+            "---",
+            "",
+            "*Remember: Every expert was once a beginner.*",
+            "",
+            f"*Generated with ❤️ by Empathetic Code Reviewer using Groq AI*"
+        ])
+
+
+class JSONRenderer(ReportRenderer):
+    """One JSON document, {"code_snippet", "experience_level", "comments": [...], "summary"};
+    each comment is its feedback fields plus index, comment, lines and resources"""
+    name = "json"
+    extension = ".json"
+    
+    def start(self, sink: TextIO, review: Dict):
+        self.first = True
+        sink.write('{"code_snippet": ' + json.dumps(review["code_snippet"], ensure_ascii=False)
+                   + ', "experience_level": ' + json.dumps(review["experience_level"]) + ', "comments": [')
+    
+    def comment(self, sink: TextIO, item: Dict):
+        entry = {"index": item["index"], "comment": item["comment"],
+                 "lines": list(item["line_range"]) if item["line_range"] else None}
+        entry.update(item["feedback"])
+        entry["resources"] = item["resources"]
+        sink.write(("\n  " if self.first else ",\n  ") + json.dumps(entry, ensure_ascii=False))
+        self.first = False
+    
+    def finish(self, sink: TextIO, summary: str):
+        sink.write(("" if self.first else "\n") + '], "summary": ' + json.dumps(summary, ensure_ascii=False) + "}\n")
+
+
+class HTMLRenderer(ReportRenderer):
+    """A standalone HTML page; every piece of review text is escaped"""
+    name = "html"
+    extension = ".html"
+    STYLE = ("body{font-family:sans-serif;max-width:60em;margin:auto;line-height:1.5}"
+             "pre{background:#f6f8fa;padding:1em;overflow-x:auto}"
+             ".degraded{border-left:4px solid #d29922;padding-left:.5em}.summary{white-space:pre-wrap}")
+    
+    def start(self, sink: TextIO, review: Dict):
+        from html import escape
+        outline = self.outline(review)
+        heading = "Original Code"
+        if outline is not None:
+            heading += f" ({len(review['context'].lines)} lines, outline shown)"
+        sink.write("<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n"
+                   f"<title>Empathetic Code Review Report</title>\n<style>{self.STYLE}</style>\n</head>\n<body>\n"
+                   "<h1>🤝 Empathetic Code Review Report</h1>\n"
+                   f"<h2>{heading}</h2>\n<pre><code>{escape(review['code_snippet'] if outline is None else outline)}</code></pre>\n")
+    
+    def comment(self, sink: TextIO, item: Dict):
+        from html import escape
+        feedback = item["feedback"]
+        emoji = self.SEVERITY_EMOJI.get(feedback.get("severity"), "✨")
+        location = self.location(item["line_range"])
+        location = f" ({location})" if location else ""
+        sink.write(f"<section>\n<h3>{emoji} Analysis of Comment {item['index']}: "
+                   f"&quot;{escape(item['comment'])}&quot;{location}</h3>\n")
+        if feedback.get("degraded"):
+            sink.write(f"<p class=\"degraded\">⏱️ <strong>Degraded:</strong> {self.DEGRADED_NOTE}</p>\n")
+        sink.write(f"<p><strong>🌟 Positive Rephrasing:</strong> {escape(feedback['positive_rephrasing'])}</p>\n"
+                   f"<p><strong>🧠 The 'Why':</strong> {escape(feedback['why_explanation'])}</p>\n"
+                   "<p><strong>💡 Suggested Improvement:</strong></p>\n"
+                   f"<pre><code>{escape(feedback['code_improvement'])}</code></pre>\n")
+        if item["resources"]:
+            sink.write("<p><strong>📚 Helpful Resources:</strong></p>\n<ul>\n")
+            for resource in item["resources"]:
+                sink.write(f"<li><a href=\"{escape(resource)}\">{escape(resource)}</a></li>\n")
+            sink.write("</ul>\n")
+        sink.write("</section>\n")
+    
+    def finish(self, sink: TextIO, summary: str):
+        from html import escape
+        sink.write(f"<h2>🎯 Overall Summary</h2>\n<div class=\"summary\">{escape(summary)}</div>\n"
+                   "<p><em>Remember: Every expert was once a beginner.</em></p>\n</body>\n</html>\n")
+
+
+class GitHubReviewRenderer(ReportRenderer):
+    """Request body for GitHub's "create a review" endpoint
+    (POST /repos/{owner}/{repo}/pulls/{number}/reviews): one review comment per comment,
+    anchored to its lines of path, with the summary as the review body. GitHub needs a line
+    for every review comment, so comments without one are anchored to line 1.
+    
+    path defaults to the job's "path", then "snippet.py".
+    """
+    name = "github"
+    extension = ".review.json"
+    
+    def __init__(self, path: str = None, commit_id: str = None, event: str = "COMMENT",
+                 max_report_lines: int = 300):
+        super().__init__(max_report_lines)
+        self.path = path
+        self.commit_id = commit_id
+        self.event = event
+    
+    def start(self, sink: TextIO, review: Dict):
+        self.first = True
+        self.review_path = self.path or review.get("path") or "snippet.py"
+        head = {"commit_id": self.commit_id} if self.commit_id else {}
+        head["event"] = self.event
+        sink.write(json.dumps(head)[:-1] + ', "comments": [')
+    
+    def comment(self, sink: TextIO, item: Dict):
+        line_range = item["line_range"] or (1, 1)
+        entry = {"path": self.review_path, "body": self.body(item), "side": "RIGHT", "line": line_range[1]}
+        if line_range[0] != line_range[1]:
+            entry.update(start_line=line_range[0], start_side="RIGHT")
+        sink.write(("\n  " if self.first else ",\n  ") + json.dumps(entry, ensure_ascii=False))
+        self.first = False
+    
+    def finish(self, sink: TextIO, summary: str):
+        sink.write(("" if self.first else "\n") + '], "body": ' + json.dumps(summary, ensure_ascii=False) + "}\n")
+    
+    def body(self, item: Dict) -> str:
+        feedback = item["feedback"]
+        emoji = self.SEVERITY_EMOJI.get(feedback.get("severity"), "✨")
+        scope = "" if item["line_range"] else " *(whole snippet)*"
+        parts = [f"{emoji} **Review comment:** {item['comment']}{scope}"]
+        if feedback.get("degraded"):
+            parts.append(f"> ⏱️ **Degraded:** {self.DEGRADED_NOTE}")
+        parts.extend([f"**🌟 Positive Rephrasing:** {feedback['positive_rephrasing']}",
+                      f"**🧠 The 'Why':** {feedback['why_explanation']}",
+                      f"**💡 Suggested Improvement:**\n```python\n{feedback['code_improvement']}\n```"])
+        if item["resources"]:
+            parts.append("**📚 Helpful Resources:**\n" + "\n".join(f"- [{r}]({r})" for r in item["resources"]))
+        return "\n\n".join(parts)
+
+
+# Report formats by name, for --format
+RENDERERS = {renderer.name: renderer for renderer in (MarkdownRenderer, JSONRenderer, HTMLRenderer, GitHubReviewRenderer)}
+
+
+class EmpatheticCodeReviewer:
+    TONE_INSTRUCTIONS = {
+        "harsh": {
+            "beginner": "Be extra gentle, encouraging, and patient.",
+            "intermediate": "Be supportive and constructive."
+        },
+        "moderate": {
+            "beginner": "Be encouraging and educational.",
+            "intermediate": "Be professional and helpful."
+        },
+        "neutral": {
+            "beginner": "Be friendly and educational.",
+            "intermediate": "Be professional and direct."
+        }
+    }
+    
+    # Longer snippets are summarized in the report header instead of echoed in full
+    MAX_REPORT_LINES = 300
+    
+    # Fields of one comment's feedback; structured_output asks for them as JSON
+    FEEDBACK_FIELDS = ("positive_rephrasing", "why_explanation", "code_improvement")
+    
+    # With less time than this left the summary is written locally / requested in short form
+    SUMMARY_SKIP_SECONDS = 1.0
+    SUMMARY_SHORT_SECONDS = 5.0
+    
+    # Matchers are compiled once, when the class is defined
+    SEVERITY_MATCHER = KeywordMatcher(SEVERITY_RULES)
+    EXPERIENCE_MATCHER = KeywordMatcher(EXPERIENCE_RULES)
+    RESOURCE_MATCHERS = {
+        language: KeywordMatcher({rule["topic"]: rule["keywords"] for rule in rules})
+        for language, rules in RESOURCE_RULES.items()
+    }
+    
+    def __init__(self, max_workers: int = 1, connect_timeout: float = 5.0, read_timeout: float = 60.0,
+                 max_retries: int = 3, backoff_base: float = 0.5, backoff_max: float = 30.0,
+                 rate_limiter: RateLimiter = None, cache: ResponseCache = None,
+                 batch_comments: bool = False, stream_responses: bool = False,
+                 metrics: ReviewMetrics = None, backends: List[LLMBackend] = None,
+                 feedback_store: FeedbackStore = None, review_deadline: float = None,
+                 rule_engine: LocalRuleEngine = None, structured_output: bool = False,
+                 structured_format: str = "json_schema"):
+        """Initialize the empathetic code reviewer with API key from .env
 
-class EmpatheticCodeReviewer:
-    def __init__(self):
-        """Initialize the empathetic code reviewer with API key from .env"""
+        max_workers > 1 processes review comments concurrently. API calls share one
+        pooled keep-alive session and retry transient failures with exponential backoff.
+        Successful responses are cached; pass ResponseCache(bypass=True) to disable.
+        batch_comments=True sends all comments of a review in a single request.
+        stream_responses=True reads completions through the SSE streaming mode.
+        Every API call and review is recorded on metrics (a ReviewMetrics).
+        backends lists OpenAI-compatible endpoints to route between and fail over
+        across; by default only Groq is used. With a feedback_store, comments similar to
+        ones already rephrased reuse the stored feedback instead of calling the LLM.
+        review_deadline is the default time budget in seconds for one process_review.
+        With a rule_engine (LocalRuleEngine), comments it covers are answered locally.
+        structured_output=True requests JSON (response_format) instead of the labelled text
+        format and re-asks only for fields missing from an answer. structured_format picks a
+        strict "json_schema" or plain "json_object" response_format; a backend that answers
+        HTTP 400 to json_schema is switched to json_object by itself.
+        """
+        # The key may also come from .env, which is only read on the first API call
+        self.groq_api_key = os.getenv("GROQ_API_KEY")
+        self.uses_default_backend = not backends
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.backends = backends or [LLMBackend(
+            "https://api.groq.com/openai/v1/chat/completions",
+            "llama3-8b-8192",  # Fast and free model
+            api_key=self.groq_api_key, name="groq", rate_limiter=self.rate_limiter
+        )]
+        self.router = BackendRouter(self.backends)
+        self.max_workers = max(1, max_workers)
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.cache = cache or ResponseCache()
+        self.batch_comments = batch_comments
+        self.stream_responses = stream_responses
+        self.metrics = metrics or ReviewMetrics()
+        self.inflight = SingleFlight()
+        self.feedback_store = feedback_store
+        self.review_deadline = review_deadline
+        self.rule_engine = rule_engine
+        self.structured_output = structured_output
+        self.structured_format = structured_format
+        self._session = None
+        self.session_lock = threading.Lock()
+    
+    @property
+    def base_url(self) -> str:
+        return self.backends[0].base_url
+    
+    @base_url.setter
+    def base_url(self, value: str):
+        self.backends[0].base_url = value
+    
+    @property
+    def model(self) -> str:
+        """Model of the primary backend; also what response cache keys are built from"""
+        return self.backends[0].model
+    
+    @model.setter
+    def model(self, value: str):
+        self.backends[0].model = value
+    
+    @property
+    def session(self) -> requests.Session:
+        """Keep-alive HTTP session, created on first use"""
+        if self._session is None:
+            with self.session_lock:
+                if self._session is None:
+                    self._session = self.create_session()
+        return self._session
+    
+    def ensure_api_key(self):
+        """Resolve the Groq API key before the first request, reading .env if needed"""
+        if not self.uses_default_backend or self.backends[0].api_key:
+            return
+        load_environment()
         self.groq_api_key = os.getenv("GROQ_API_KEY")
         if not self.groq_api_key:
-            raise ValueError("❌ GROQ_API_KEY not found in environment variables. Please set it in your .env file.")
-        self.base_url = "https://api.groq.com/openai/v1/chat/completions"
-        self.model = "llama3-8b-8192"  # Fast and free model
-        
-    def make_groq_request(self, messages: List[Dict], max_tokens: int = 500, temperature: float = 0.7) -> str:
-        """Make a request to Groq API"""
-        headers = {
-            "Authorization": f"Bearer {self.groq_api_key}",
-            "Content-Type": "application/json"
-        }
+            raise ConfigurationError("❌ GROQ_API_KEY not found in environment variables. Please set it in your .env file.")
+        self.backends[0].api_key = self.groq_api_key
+    
+    def create_session(self) -> requests.Session:
+        """Create a keep-alive session sized for the worker pool"""
+        import requests
+        from requests.adapters import HTTPAdapter
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.backends), pool_maxsize=max(10, self.max_workers))
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+    
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+        self.cache.close()
+        if self.feedback_store:
+            self.feedback_store.close()
+    
+    def backoff_delay(self, attempt: int, retry_after: float = None) -> float:
+        """Exponential backoff with full jitter, never shorter than the server's Retry-After"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after:
+            delay = max(delay, retry_after)
+        return delay
         
+    def make_groq_request(self, messages: List[Dict], max_tokens: int = 500, temperature: float = 0.7,
+                          use_cache: bool = True, stream: bool = None,
+                          on_delta: Callable[[str], None] = None, stage: str = "feedback",
+                          response_format: Dict = None, validate: Callable[[str], bool] = None) -> str:
+        """Make a request to Groq API, serving repeated prompts from the response cache
+
+        With stream=True the completion is read as server-sent events and each text
+        delta is passed to on_delta as it arrives; the full text is still returned.
+        stage labels the call in the metrics; response_format is passed through as is.
+        Answers validate rejects (e.g. with blank fields) are returned but neither cached
+        nor served from the cache, so a re-run asks again.
+        """
+        call = self.new_call(stage)
+        if stream is None:
+            stream = self.stream_responses or on_delta is not None
         payload = {
             "model": self.model,
             "messages": messages,
             "max_tokens": max_tokens,
             "temperature": temperature,
         }
+        if stream:
+            payload["stream"] = True
+            payload["stream_options"] = {"include_usage": True}
+        if response_format:
+            payload["response_format"] = response_format
+        
+        key = ResponseCache.make_key(self.model, messages, max_tokens, temperature) if use_cache else None
+        if key:
+            cached = self.cache.get(key)
+            if cached is not None and (validate is None or validate(cached)):
+                if on_delta:
+                    on_delta(cached)
+                call["cached"] = True
+                self.finish_call(call)
+                return cached
+            # Identical requests already in flight share a single upstream call
+            try:
+                content, call["coalesced"] = self.inflight.do(key, self.request_with_retries, payload, on_delta, call)
+            except DeadlineExceeded:
+                self.finish_deadline_call(call)
+                raise
+            if call["coalesced"] and on_delta and content is not None:
+                on_delta(content)
+        else:
+            try:
+                content = self.request_with_retries(payload, on_delta, call)
+            except DeadlineExceeded:
+                self.finish_deadline_call(call)
+                raise
+        if content is None:
+            call["fallback"] = True
+            self.finish_call(call)
+            return self.get_fallback_response()
+        if key and (validate is None or validate(content)):
+            self.cache.set(key, content)
+        self.finish_call(call)
+        return content
+    
+    def new_call(self, stage: str) -> Dict:
+        return {"stage": stage, "model": self.model, "started_at": time.perf_counter(), "wall_time": 0.0,
+                "prompt_tokens": 0, "completion_tokens": 0, "retries": 0,
+                "cached": False, "coalesced": False, "fallback": False, "error": None}
+    
+    def finish_call(self, call: Dict):
+        call["wall_time"] = time.perf_counter() - call.pop("started_at")
+        self.metrics.record_call(call)
+    
+    def finish_deadline_call(self, call: Dict):
+        if "started_at" in call:
+            call["fallback"] = True
+            call["deadline"] = True
+            call["error"] = "deadline exceeded"
+            self.finish_call(call)
+    
+    @staticmethod
+    def wait_for_retry(deadline: Optional[Deadline], delay: float):
+        """Raise DeadlineExceeded instead of backing off past the review deadline"""
+        remaining = deadline.remaining() if deadline else None
+        if remaining is not None and delay >= remaining:
+            raise DeadlineExceeded("review deadline exceeded while backing off")
+    
+    def request_with_retries(self, payload: Dict, on_delta: Callable[[str], None] = None,
+                             call: Dict = None) -> Optional[str]:
+        """POST a chat-completions payload, failing over between backends and retrying
+        transient failures; None if it never succeeds"""
+        self.ensure_api_key()
+        call = call if call is not None else {}
+        deadline = CURRENT_DEADLINE.get()
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            call["retries"] = attempt
+            retryable = False
+            retry_after = None
+            for backend in self.router.route():
+                if deadline:
+                    deadline.check()
+                started_at = time.perf_counter()
+                try:
+                    content = self.request_once(backend, payload, on_delta, call)
+                except BackendError as e:
+                    backend.record(False, time.perf_counter() - started_at)
+                    last_error = e
+                    retryable = retryable or e.retryable
+                    retry_after = max(retry_after or 0.0, e.retry_after or 0.0)
+                    if not e.retryable:
+                        print(f"Error calling {backend.name}: {e}")
+                    continue
+                backend.record(True, time.perf_counter() - started_at)
+                call["backend"] = backend.name
+                call["model"] = backend.model
+                return content
+            
+            if not retryable:
+                break
+            if attempt < self.max_retries:
+                delay = self.backoff_delay(attempt, retry_after)
+                self.wait_for_retry(deadline, delay)
+                time.sleep(delay)
         
+        print(f"Error calling Groq API after {call['retries'] + 1} attempts: {last_error}")
+        call["error"] = str(last_error)
+        return None
+    
+    def request_once(self, backend: LLMBackend, payload: Dict, on_delta: Callable[[str], None] = None,
+                     call: Dict = None) -> str:
+        """Send one attempt to one backend; raises BackendError on any failure"""
+        import requests
+        stream = payload.get("stream", False)
+        deadline = CURRENT_DEADLINE.get() or Deadline()
+        sent = backend.payload(payload)
         try:
-            response = requests.post(self.base_url, headers=headers, json=payload)
-            response.raise_for_status()
-            data = response.json()
-            return data["choices"][0]["message"]["content"]
+            with self.session.post(backend.base_url, json=sent, headers=backend.headers, stream=stream,
+                                   timeout=(deadline.cap(self.connect_timeout), deadline.cap(self.read_timeout))) as response:
+                backend.rate_limiter.update_from_headers(response.headers)
+                if backend.rejected_json_schema(sent, response):
+                    return self.request_once(backend, payload, on_delta, call)
+                if response.status_code in RETRYABLE_STATUS:
+                    retry_after = parse_duration(response.headers.get("Retry-After", ""))
+                    if response.status_code == 429:
+                        backend.rate_limiter.pause(retry_after or self.backoff_base)
+                    raise BackendError(f"HTTP {response.status_code}", retry_after=retry_after)
+                response.raise_for_status()
+                if stream:
+                    return self.read_event_stream(response, on_delta, deadline, call)
+                data = response.json()
+                if call is not None:
+                    self.record_usage(call, data)
+                return data["choices"][0]["message"]["content"]
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            raise BackendError(str(e))
         except requests.exceptions.RequestException as e:
-            print(f"Error calling Groq API: {e}")
-            return self.get_fallback_response()
-        except Exception as e:
-            print(f"Unexpected error: {e}")
-            return self.get_fallback_response()
+            raise BackendError(str(e), retryable=False)
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            raise BackendError(f"Unexpected response: {e}", retryable=False)
+    
+    @staticmethod
+    def record_usage(call: Dict, data: Dict):
+        # Groq reports a stream's usage under x_groq in its last chunk
+        usage = data.get("usage") or (data.get("x_groq") or {}).get("usage") or {}
+        call["prompt_tokens"] = usage.get("prompt_tokens", 0)
+        call["completion_tokens"] = usage.get("completion_tokens", 0)
+    
+    def read_event_stream(self, response: requests.Response, on_delta: Callable[[str], None] = None,
+                          deadline: Deadline = None, call: Dict = None) -> str:
+        """Accumulate the content deltas of a chat-completions SSE stream, recording its usage in call"""
+        parts = []
+        for raw_line in response.iter_lines():
+            if deadline and deadline.expired():
+                # The read timeout only bounds each chunk, so a slow trickle is cut off here
+                raise BackendError("review deadline reached mid-stream")
+            line = raw_line.decode("utf-8")
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            chunk = json.loads(data)
+            if call is not None and (chunk.get("usage") or chunk.get("x_groq", {}).get("usage")):
+                self.record_usage(call, chunk)
+            # The usage-only chunk sent for stream_options.include_usage has no choices
+            delta = chunk["choices"][0].get("delta", {}).get("content") if chunk.get("choices") else None
+            if delta:
+                parts.append(delta)
+                if on_delta:
+                    on_delta(delta)
+        if not parts:
+            # e.g. a server that ignored "stream": true and answered plain JSON
+            raise BackendError("the event stream carried no content", retryable=False)
+        return "".join(parts)
     
     def get_fallback_response(self) -> str:
         """Fallback response if API fails"""
@@ -54,46 +2040,31 @@ WHY_EXPLANATION: These improvements will help make your code more efficient, rea
 CODE_IMPROVEMENT: # Improved version would go here"""
 
     def analyze_comment_severity(self, comment: str) -> str:
-        harsh_indicators = ['bad', 'wrong', 'terrible', 'awful', 'stupid', 'inefficient', 'horrible', 'trash']
-        moderate_indicators = ['could be better', 'consider', 'might want', 'should', 'redundant']
-        
-        comment_lower = comment.lower()
-        if any(i in comment_lower for i in harsh_indicators):
+        labels = self.SEVERITY_MATCHER.find_labels(comment)
+        if "harsh" in labels:
             return "harsh"
-        elif any(i in comment_lower for i in moderate_indicators):
+        elif "moderate" in labels:
             return "moderate"
         else:
             return "neutral"
     
     def get_relevant_resources(self, comment: str, code_language: str = "python") -> List[str]:
+        language = code_language.lower()
+        matcher = self.RESOURCE_MATCHERS.get(language)
+        if matcher is None:
+            return []
+        
+        topics = matcher.find_labels(comment)
         resources = []
-        comment_lower = comment.lower()
-        
-        if code_language.lower() == "python":
-            if "variable" in comment_lower or "name" in comment_lower:
-                resources.extend([
-                    "https://pep8.org/#naming-conventions",
-                    "https://realpython.com/python-pep8/#naming-conventions"
-                ])
-            if "boolean" in comment_lower or "== true" in comment_lower or "redundant" in comment_lower:
-                resources.extend([
-                    "https://pep8.org/#programming-recommendations",
-                    "https://docs.python.org/3/tutorial/datastructures.html#more-on-conditions"
-                ])
-            if "inefficient" in comment_lower or "performance" in comment_lower or "loop" in comment_lower:
-                resources.extend([
-                    "https://docs.python.org/3/tutorial/datastructures.html#list-comprehensions",
-                    "https://realpython.com/list-comprehension-python/"
-                ])
+        for rule in RESOURCE_RULES[language]:
+            if rule["topic"] in topics:
+                resources.extend(rule["resources"])
         return resources
     
     def detect_experience_level(self, code_snippet: str) -> str:
-        beginner_patterns = ['== True', '== False', 'results = []', 'append(', 'range(len(']
-        intermediate_patterns = ['comprehension', 'lambda', 'yield', 'enumerate', 'zip']
-        
-        code_lower = code_snippet.lower()
-        beginner_score = sum(1 for p in beginner_patterns if p in code_lower)
-        intermediate_score = sum(1 for p in intermediate_patterns if p in code_lower)
+        scores = self.EXPERIENCE_MATCHER.count_labels(code_snippet)
+        beginner_score = scores.get("beginner", 0)
+        intermediate_score = scores.get("intermediate", 0)
         
         if beginner_score >= 2 and intermediate_score == 0:
             return "beginner"
@@ -102,26 +2073,70 @@ CODE_IMPROVEMENT: # Improved version would go here"""
         else:
             return "beginner"
     
-    def generate_empathetic_feedback(self, code_snippet: str, original_comment: str) -> Dict[str, str]:
+    def generate_empathetic_feedback(self, code_snippet: str, original_comment: str,
+                                     experience_level: str = None) -> Dict[str, str]:
         severity = self.analyze_comment_severity(original_comment)
-        experience_level = self.detect_experience_level(code_snippet)
-        
-        tone_instructions = {
-            "harsh": {
-                "beginner": "Be extra gentle, encouraging, and patient.",
-                "intermediate": "Be supportive and constructive."
-            },
-            "moderate": {
-                "beginner": "Be encouraging and educational.",
-                "intermediate": "Be professional and helpful."
-            },
-            "neutral": {
-                "beginner": "Be friendly and educational.",
-                "intermediate": "Be professional and direct."
-            }
-        }
+        experience_level = experience_level or self.detect_experience_level(code_snippet)
+        local = self.answer_locally(code_snippet, original_comment, severity, experience_level)
+        if local:
+            return local
+        stored = self.lookup_stored_feedback(code_snippet, original_comment, severity, experience_level)
+        if stored:
+            return stored
+        messages = self.build_feedback_messages(code_snippet, original_comment, severity, experience_level)
         
-        tone_instruction = tone_instructions[severity][experience_level]
+        if self.structured_output:
+            response_content = self.make_groq_request(messages, max_tokens=600, temperature=0.7,
+                                                      response_format=self.feedback_format(), validate=self.is_complete)
+            parsed_response = self.parse_structured_response(response_content)
+            missing = self.missing_fields(parsed_response, response_content)
+            if missing:
+                retry_content = self.make_groq_request(self.build_reask_messages(messages, response_content, missing),
+                                                       max_tokens=400, temperature=0.3, stage="reask",
+                                                       response_format=self.feedback_format(missing),
+                                                       validate=lambda content: self.is_complete(content, missing))
+                self.merge_reask(parsed_response, retry_content, missing)
+        else:
+            response_content = self.make_groq_request(messages, max_tokens=600, temperature=0.7,
+                                                      validate=self.is_complete)
+            parsed_response = self.parse_groq_response(response_content)
+            self.missing_fields(parsed_response, response_content)
+        self.store_feedback(code_snippet, original_comment, response_content, parsed_response)
+        parsed_response["severity"] = severity
+        parsed_response["experience_level"] = experience_level
+        return parsed_response
+    
+    def answer_locally(self, code_snippet: str, original_comment: str,
+                       severity: str, experience_level: str) -> Optional[Dict[str, str]]:
+        if self.rule_engine is None:
+            return None
+        local = self.rule_engine.answer(code_snippet, original_comment, experience_level)
+        if local:
+            local["severity"] = severity
+            local["experience_level"] = experience_level
+            self.metrics.record_local_answer(local["local_rule"])
+        return local
+    
+    def lookup_stored_feedback(self, code_snippet: str, original_comment: str,
+                               severity: str, experience_level: str) -> Optional[Dict[str, str]]:
+        if self.feedback_store is None:
+            return None
+        stored = self.feedback_store.lookup(original_comment, code_snippet)
+        if stored:
+            stored["severity"] = severity
+            stored["experience_level"] = experience_level
+        return stored
+    
+    def store_feedback(self, code_snippet: str, original_comment: str, response_content: str,
+                       parsed_response: Dict[str, str]):
+        """Keep real LLM answers (never the canned fallback or unparsable ones) for later reuse"""
+        if (self.feedback_store is not None and response_content != self.get_fallback_response()
+                and parsed_response["positive_rephrasing"] and parsed_response["why_explanation"]):
+            self.feedback_store.add(original_comment, code_snippet, dict(parsed_response))
+    
+    def build_feedback_messages(self, code_snippet: str, original_comment: str,
+                                severity: str, experience_level: str) -> List[Dict]:
+        tone_instruction = self.TONE_INSTRUCTIONS[severity][experience_level]
         
         prompt = f"""You are an experienced, empathetic senior developer...
 **Original harsh comment:** "{original_comment}"
@@ -129,17 +2144,158 @@ CODE_IMPROVEMENT: # Improved version would go here"""
 ```python
 {code_snippet}
 ```"""
+        if self.structured_output:
+            prompt += f"""
+
+Tone: {tone_instruction}
+Answer with a JSON object with the string fields "positive_rephrasing" (an encouraging rephrasing of
+the comment), "why_explanation" (why the change matters) and "code_improvement" (the improved code)."""
+        
+        return [
+            {"role": "system", "content": "You are an empathetic senior developer."},
+            {"role": "user", "content": prompt}
+        ]
+    
+    def generate_batched_feedback(self, code_snippet: str, comments: List[str], prompt_codes: List[str] = None,
+                                  outline: str = "") -> List[Dict[str, str]]:
+        """Rephrase every comment in one request, re-asking per comment only for blocks that fail to parse.
+        Comments a local rule or the feedback store covers are answered without being sent.
+
+        prompt_codes and outline optionally give each comment its own excerpt and the file outline
+        shown once beside them (see SnippetContext.batch_prompt_code) instead of code_snippet.
+        """
+        experience_level = self.detect_experience_level(code_snippet)
+        severities = [self.analyze_comment_severity(c) for c in comments]
+        prompt_codes = prompt_codes or [code_snippet] * len(comments)
+        answered = {}
+        for i, (comment, severity) in enumerate(zip(comments, severities)):
+            known = (self.answer_locally(prompt_codes[i], comment, severity, experience_level)
+                     or self.lookup_stored_feedback(prompt_codes[i], comment, severity, experience_level))
+            if known:
+                answered[i] = known
+        pending = [i for i in range(len(comments)) if i not in answered]
+        if pending:
+            answered.update(self.request_batched_feedback(prompt_codes, comments, pending, severities,
+                                                          experience_level, outline))
+        
+        feedback_items = []
+        for i, severity in enumerate(severities):
+            feedback = answered[i]
+            feedback["severity"] = severity
+            feedback["experience_level"] = experience_level
+            feedback_items.append(feedback)
+        return feedback_items
+    
+    def request_batched_feedback(self, prompt_codes: List[str], comments: List[str], pending: List[int],
+                                 severities: List[str], experience_level: str,
+                                 outline: str = "") -> Dict[int, Dict[str, str]]:
+        """One LLM request for the comments at the pending indices; returns feedback keyed by those indices.
+
+        prompt_codes holds the code of every comment; comments sharing the same code share one excerpt.
+        A comment re-asked on its own gets its code plus the outline.
+        """
+        excerpts = {}  # code -> its excerpt number, in order of first use
+        for i in pending:
+            excerpts.setdefault(prompt_codes[i], len(excerpts) + 1)
+        enumerated = "\n".join(
+            f'{number}. "{comments[i]}" (tone: {self.TONE_INSTRUCTIONS[severities[i]][experience_level]})'
+            + (f" (code: excerpt {excerpts[prompt_codes[i]]})" if len(excerpts) > 1 else "")
+            for number, i in enumerate(pending, 1)
+        )
+        if len(excerpts) > 1:
+            code_section = "\n\n".join(f"Excerpt {number}:\n```python\n{code}\n```"
+                                        for code, number in excerpts.items())
+        else:
+            code_section = f"```python\n{prompt_codes[pending[0]]}\n```"
+        if outline:
+            code_section += f"\n\n```python\n{outline.strip()}\n```"
+        if self.structured_output:
+            answer_format = """Answer with a JSON object {"feedback": [...]} holding one entry per comment with the
+fields "comment" (its number), "positive_rephrasing" (encouraging rephrasing), "why_explanation"
+(why the change matters) and "code_improvement" (improved code)."""
+        else:
+            answer_format = """For every comment, answer with one block in exactly this format:
+=== COMMENT <number> ===
+POSITIVE_REPHRASING: <encouraging rephrasing>
+WHY_EXPLANATION: <why the change matters>
+CODE_IMPROVEMENT: <improved code>"""
+        prompt = f"""You are an experienced, empathetic senior developer. Rewrite each review comment below
+into constructive, encouraging feedback for the code that follows.
+
+{answer_format}
+
+**Review comments:**
+{enumerated}
+
+**Code being reviewed:**
+{code_section}"""
         
         messages = [
             {"role": "system", "content": "You are an empathetic senior developer."},
             {"role": "user", "content": prompt}
         ]
         
-        response_content = self.make_groq_request(messages, max_tokens=600, temperature=0.7)
-        parsed_response = self.parse_groq_response(response_content)
-        parsed_response["severity"] = severity
-        parsed_response["experience_level"] = experience_level
-        return parsed_response
+        max_tokens = min(400 * len(pending) + 200, 4096)
+        parse_batch = self.parse_structured_batch if self.structured_output else self.parse_batched_groq_response
+        response_content = self.make_groq_request(
+            messages, max_tokens=max_tokens, temperature=0.7, stage="batch",
+            response_format=self.feedback_format(batched=True) if self.structured_output else None,
+            validate=lambda content: len(parse_batch(content, len(pending))) == len(pending))
+        blocks = parse_batch(response_content, len(pending))
+        if response_content != self.get_fallback_response():
+            for number in range(len(pending)):
+                self.metrics.record_format(len(self.FEEDBACK_FIELDS) if number not in blocks else
+                                           sum(1 for field in self.FEEDBACK_FIELDS if not blocks[number][field]))
+        parsed_blocks = {pending[number]: block for number, block in blocks.items()}
+        for i, block in parsed_blocks.items():
+            self.store_feedback(prompt_codes[i], comments[i], response_content, block)
+        
+        failed = [i for i in pending if i not in parsed_blocks]
+        if failed:
+            print(f"  🔁 Re-requesting {len(failed)} comment(s) that could not be parsed from the batch...")
+            from concurrent.futures import ThreadPoolExecutor
+            workers = min(self.max_workers, len(failed))
+            review = CURRENT_REVIEW.get()
+            deadline = CURRENT_DEADLINE.get() or Deadline()
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                retried = list(pool.map(
+                    lambda i: ReviewMetrics.track(review, deadline.run, self.safe_empathetic_feedback,
+                                                  prompt_codes[i] + outline, comments[i], experience_level),
+                    failed))
+            parsed_blocks.update(zip(failed, retried))
+        return parsed_blocks
+    
+    def parse_batched_groq_response(self, content: str, comment_count: int) -> Dict[int, Dict[str, str]]:
+        """Split a batched response into per-comment blocks keyed by 0-based comment index.
+
+        Blocks that are missing or lack a rephrasing/explanation are left out.
+        """
+        blocks = {}
+        parts = re.split(r'^\s*=+\s*COMMENT\s+(\d+)\s*=+\s*$', content, flags=re.MULTILINE)
+        for number, body in zip(parts[1::2], parts[2::2]):
+            index = int(number) - 1
+            if 0 <= index < comment_count and index not in blocks:
+                parsed = self.parse_groq_response(body)
+                if parsed["positive_rephrasing"] and parsed["why_explanation"]:
+                    blocks[index] = parsed
+        return blocks
+    
+    def parse_structured_batch(self, content: str, comment_count: int) -> Dict[int, Dict[str, str]]:
+        """JSON counterpart of parse_batched_groq_response, with the same rule for incomplete entries"""
+        try:
+            entries = json.loads(content).get("feedback")
+        except (ValueError, AttributeError):
+            return self.parse_batched_groq_response(content, comment_count)
+        blocks = {}
+        for entry in entries if isinstance(entries, list) else []:
+            if not isinstance(entry, dict) or not isinstance(entry.get("comment"), int):
+                continue
+            index = entry["comment"] - 1
+            parsed = {field: entry[field].strip() if isinstance(entry.get(field), str) else ""
+                      for field in self.FEEDBACK_FIELDS}
+            if 0 <= index < comment_count and index not in blocks and parsed["positive_rephrasing"] and parsed["why_explanation"]:
+                blocks[index] = parsed
+        return blocks
     
     def parse_groq_response(self, content: str) -> Dict[str, str]:
         try:
@@ -159,87 +2315,611 @@ CODE_IMPROVEMENT: # Improved version would go here"""
                 "code_improvement": ""
             }
     
-    def generate_holistic_summary(self, feedback_items: List[Dict], code_snippet: str) -> str:
+    def feedback_format(self, fields: Iterable[str] = None, batched: bool = False) -> Dict:
+        """response_format asking for the given feedback fields (all by default) as JSON"""
+        if self.structured_format == "json_object":
+            return {"type": "json_object"}
+        fields = list(fields or self.FEEDBACK_FIELDS)
+        schema = {"type": "object", "properties": {field: {"type": "string"} for field in fields},
+                  "required": fields, "additionalProperties": False}
+        if batched:
+            item = dict(schema, properties=dict(schema["properties"], comment={"type": "integer"}),
+                        required=["comment"] + fields)
+            schema = {"type": "object", "properties": {"feedback": {"type": "array", "items": item}},
+                      "required": ["feedback"], "additionalProperties": False}
+        return {"type": "json_schema",
+                "json_schema": {"name": "batched_feedback" if batched else "feedback", "strict": True, "schema": schema}}
+    
+    def parse_structured_response(self, content: str, fields: Iterable[str] = None) -> Dict[str, str]:
+        """Read the feedback fields from a JSON answer in one json.loads; an answer that is not
+        JSON (e.g. the canned fallback) is read with the labelled-text parser instead"""
+        fields = list(fields or self.FEEDBACK_FIELDS)
+        try:
+            data = json.loads(content)
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            data = self.parse_groq_response(content)
+        return {field: data[field].strip() if isinstance(data.get(field), str) else "" for field in fields}
+    
+    def is_complete(self, content: str, fields: Iterable[str] = None) -> bool:
+        """Whether an answer has every requested feedback field; incomplete answers are not cached"""
+        if self.structured_output:
+            return all(self.parse_structured_response(content, fields).values())
+        return all(self.parse_groq_response(content).values())
+    
+    def missing_fields(self, feedback: Dict[str, str], content: str) -> List[str]:
+        """Fields an LLM answer left blank, counted toward the format-failure rate.
+        The canned fallback is an API failure, not a format one, and is not counted."""
+        if content == self.get_fallback_response():
+            return []
+        missing = [field for field in self.FEEDBACK_FIELDS if not feedback.get(field)]
+        if not (self.structured_output and missing):
+            self.metrics.record_format(len(missing))
+        return missing
+    
+    def build_reask_messages(self, messages: List[Dict], content: str, missing: List[str]) -> List[Dict]:
+        """Follow-up asking only for the fields the previous answer lacked"""
+        return messages + [
+            {"role": "assistant", "content": content},
+            {"role": "user", "content": f"Your answer is missing {', '.join(missing)}. Reply with a JSON object "
+                                        f"containing only these fields: {', '.join(missing)}."},
+        ]
+    
+    def merge_reask(self, feedback: Dict[str, str], retry_content: str, missing: List[str]):
+        if retry_content != self.get_fallback_response():
+            for field, value in self.parse_structured_response(retry_content, missing).items():
+                if value:
+                    feedback[field] = value
+        still_missing = [field for field in missing if not feedback.get(field)]
+        self.metrics.record_format(len(missing), reasked=True, recovered=not still_missing)
+    
+    def generate_holistic_summary(self, feedback_items: Union[List[Dict], FeedbackTally], code_snippet: str,
+                                  max_tokens: int = 200) -> str:
+        messages = self.build_summary_messages(feedback_items, code_snippet)
+        summary = self.make_groq_request(messages, max_tokens=max_tokens, temperature=0.8, stage="summary")
+        return summary.strip()
+    
+    def summary_budget(self, deadline: Deadline) -> Optional[int]:
+        """max_tokens for the summary given the time left: None means write it locally instead"""
+        remaining = deadline.remaining()
+        if remaining is None or remaining >= self.SUMMARY_SHORT_SECONDS:
+            return 200
+        if remaining >= self.SUMMARY_SKIP_SECONDS:
+            return 80
+        return None
+    
+    def safe_holistic_summary(self, feedback_items: Union[List[Dict], FeedbackTally], code_snippet: str, deadline: Deadline) -> str:
+        max_tokens = self.summary_budget(deadline)
+        if max_tokens is None:
+            return self.local_summary(feedback_items)
+        try:
+            return deadline.run(self.generate_holistic_summary, feedback_items, code_snippet, max_tokens)
+        except DeadlineExceeded:
+            return self.local_summary(feedback_items)
+    
+    def local_summary(self, feedback_items: Union[List[Dict], FeedbackTally]) -> str:
+        """Short summary written without the LLM when the review deadline leaves no time for one"""
+        tally = FeedbackTally.of(feedback_items)
+        note = f", {tally.degraded} of them with local guidance only" if tally.degraded else ""
+        return (f"⏱️ *Degraded: the review deadline was reached, so this summary was shortened.*\n\n"
+                f"You received {tally.count} suggestion(s){note}. Each one is a small, concrete "
+                f"step toward cleaner code - great job putting your work up for review!")
+    
+    def build_summary_messages(self, feedback_items: Union[List[Dict], FeedbackTally], code_snippet: str) -> List[Dict]:
         experience_level = self.detect_experience_level(code_snippet)
-        feedback_count = len(feedback_items)
-        harsh_count = sum(1 for f in feedback_items if f.get("severity") == "harsh")
+        tally = FeedbackTally.of(feedback_items)
+        feedback_count = tally.count
+        harsh_count = tally.harsh
         
         prompt = f"""Write an encouraging summary..."""
         
-        messages = [
+        return [
             {"role": "system", "content": "You are a supportive coding mentor."},
             {"role": "user", "content": prompt}
         ]
-        
-        summary = self.make_groq_request(messages, max_tokens=200, temperature=0.8)
-        return summary.strip()
     
-    def process_review(self, input_data: Dict) -> str:
+    def safe_empathetic_feedback(self, code_snippet: str, original_comment: str,
+                                 experience_level: str = None) -> Dict[str, str]:
+        """Generate feedback for one comment without letting a failure abort the review"""
+        try:
+            return self.generate_empathetic_feedback(code_snippet, original_comment, experience_level)
+        except ConfigurationError:
+            raise
+        except DeadlineExceeded:
+            return self.degraded_feedback(code_snippet, original_comment, experience_level)
+        except Exception as e:
+            print(f"Error generating feedback: {e}")
+            return self.fallback_feedback(code_snippet, original_comment, experience_level)
+    
+    def fallback_feedback(self, code_snippet: str, original_comment: str,
+                          experience_level: str = None) -> Dict[str, str]:
+        feedback = self.parse_groq_response(self.get_fallback_response())
+        feedback["severity"] = self.analyze_comment_severity(original_comment)
+        feedback["experience_level"] = experience_level or self.detect_experience_level(code_snippet)
+        return feedback
+    
+    def degraded_feedback(self, code_snippet: str, original_comment: str,
+                          experience_level: str = None) -> Dict[str, str]:
+        """Local fallback for a comment the review deadline cut off, marked so the report says so.
+        Comments a local rule covers keep their full answer."""
+        experience_level = experience_level or self.detect_experience_level(code_snippet)
+        local = self.answer_locally(code_snippet, original_comment,
+                                    self.analyze_comment_severity(original_comment), experience_level)
+        if local:
+            return local
+        feedback = self.fallback_feedback(code_snippet, original_comment, experience_level)
+        feedback["degraded"] = True
+        return feedback
+    
+    @staticmethod
+    def normalize_comment(item) -> Tuple[str, Optional[Tuple[int, int]]]:
+        """Accept a plain comment string or {"comment": str, "lines": [start, end] | line};
+        anything else in "lines" leaves the comment without a range"""
+        if not isinstance(item, dict):
+            return item, None
+        text = item.get("comment") or item.get("text") or ""
+        lines = item.get("lines", item.get("line"))
+        if isinstance(lines, int):
+            lines = [lines]
+        if not isinstance(lines, (list, tuple)) or not 1 <= len(lines) <= 2 or \
+                not all(isinstance(line, int) and not isinstance(line, bool) for line in lines):
+            return text, None
+        return text, (min(lines), max(lines))
+    
+    def prepare_review(self, input_data: Dict) -> Dict:
+        """Parse the snippet once per review and normalize its comments; the code each comment's
+        prompt gets is context.prompt_code(line_range), worked out when the comment is sent"""
         code_snippet = input_data["code_snippet"]
-        review_comments = input_data["review_comments"]
+        comments = [self.normalize_comment(item) for item in input_data["review_comments"]]
+        context = SnippetContext(code_snippet)
+        # Ranges past the end of the snippet become general comments
+        line_ranges = [context.clamp(line_range) for _, line_range in comments]
+        return {
+            "code_snippet": code_snippet,
+            "context": context,
+            "comments": [text for text, _ in comments],
+            "line_ranges": line_ranges,
+            "experience_level": self.detect_experience_level(code_snippet),
+        }
+    
+    def build_comment_section(self, index: int, comment: str, feedback: Dict[str, str],
+                              line_range: Tuple[int, int] = None) -> str:
+        return MarkdownRenderer(self.MAX_REPORT_LINES).section({
+            "index": index, "comment": comment, "feedback": feedback, "line_range": line_range,
+            "resources": self.get_relevant_resources(comment)})
+    
+    def process_review(self, input_data: Dict, max_workers: int = None, deadline: float = None,
+                       record: Dict = None) -> str:
+        return '\n'.join(self.iter_review(input_data, max_workers, deadline, record))
+    
+    def write_review(self, input_data: Dict, sink: TextIO, max_workers: int = None, deadline: float = None,
+                     renderer: ReportRenderer = None):
+        """Write the report to a file-like sink section by section as each one becomes ready.
+
+        renderer picks the format (see RENDERERS); the default is the markdown of process_review.
+        Only the section being written is held in memory, not the whole report.
+        """
+        renderer = renderer or MarkdownRenderer(self.MAX_REPORT_LINES)
+        renderer.render(self.iter_feedback(input_data, max_workers, deadline), sink)
+    
+    def iter_review(self, input_data: Dict, max_workers: int = None, deadline: float = None,
+                    record: Dict = None) -> Iterator[str]:
+        """Yield the markdown report in order: header, one section per comment as soon as it is ready, summary"""
+        markdown = MarkdownRenderer(self.MAX_REPORT_LINES)
+        for kind, data in self.iter_feedback(input_data, max_workers, deadline, record):
+            if kind == "start":
+                yield markdown.header(data)
+            elif kind == "comment":
+                yield markdown.section(data)
+            else:
+                yield markdown.footer(data)
+    
+    def iter_feedback(self, input_data: Dict, max_workers: int = None, deadline: float = None,
+                      record: Dict = None) -> Iterator[Tuple[str, object]]:
+        """Run a review, yielding report events in order as soon as each is ready: ("start", review),
+        ("comment", item) per comment, then ("finish", summary). A ReportRenderer turns them into a report.
+
+        review holds code_snippet, context (a SnippetContext), experience_level, comment_count and
+        path; item holds index, comment, line_range, feedback and resources. Feedback is not kept
+        after it is yielded and only a few comments per worker are in flight, so memory does not
+        grow with the number of comments.
+
+        deadline (seconds, default review_deadline) bounds the whole review: every request is
+        capped to it, and comments still pending when it expires get degraded local feedback.
+        A record dict passed in is filled with the review's metrics (see ReviewMetrics.new_review),
+        e.g. so callers can tell from failed_calls whether any answer is the canned fallback.
+        """
+        deadline = Deadline(self.review_deadline if deadline is None else deadline)
+        prepared = self.prepare_review(input_data)
+        code_snippet = prepared["code_snippet"]
+        context = prepared["context"]
+        review_comments = prepared["comments"]
+        line_ranges = prepared["line_ranges"]
+        experience_level = prepared["experience_level"]
+        workers = min(max_workers or self.max_workers, len(review_comments)) or 1
+        review = ReviewMetrics.new_review(len(review_comments))
+        if record is not None:
+            record.update(review)
+            review = record
+        started_at = time.perf_counter()
+        track = ReviewMetrics.track
+        tally = FeedbackTally()
         
-        markdown_sections = [
-            "# 🤝 Empathetic Code Review Report",
-            "",
-            "**Original Code:**",
-            "```python",
-            code_snippet,
-            "```",
-            ""
-        ]
+        def comment_event(index: int, feedback: Dict) -> Tuple[str, Dict]:
+            tally.add(feedback)
+            comment = review_comments[index - 1]
+            return "comment", {"index": index, "comment": comment, "line_range": line_ranges[index - 1],
+                               "feedback": feedback, "resources": self.get_relevant_resources(comment)}
+        
+        yield "start", {"code_snippet": code_snippet, "context": context, "experience_level": experience_level,
+                        "comment_count": len(review_comments), "path": input_data.get("path")}
         
-        feedback_items = []
         print(f"Processing {len(review_comments)} comments with Groq AI...")
         
-        for i, comment in enumerate(review_comments, 1):
-            print(f"  ⚡ Processing comment {i}/{len(review_comments)}...")
-            feedback = self.generate_empathetic_feedback(code_snippet, comment)
-            feedback_items.append(feedback)
+        if self.batch_comments and len(review_comments) > 1:
+            print(f"  ⚡ Sending all {len(review_comments)} comments in a single request...")
+            batch_comments = [
+                f"{comment} (lines {line_range[0]}-{line_range[1]})" if line_range else comment
+                for comment, line_range in zip(review_comments, line_ranges)
+            ]
+            prompt_codes, outline = context.batch_prompt_code(line_ranges)
+            try:
+                feedback_items = track(review, deadline.run, self.generate_batched_feedback,
+                                       context.prompt_code(), batch_comments, prompt_codes, outline)
+            except DeadlineExceeded:
+                feedback_items = [self.degraded_feedback(code_snippet, comment, experience_level)
+                                  for comment in review_comments]
+            for i, feedback in enumerate(feedback_items, 1):
+                yield comment_event(i, feedback)
+        elif workers > 1:
+            # Keep a couple of requests per worker queued and emit results in the original comment order
+            print(f"  ⚡ Running up to {workers} requests concurrently...")
+            from collections import deque
+            from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+            pool = ThreadPoolExecutor(max_workers=workers)
+            in_flight = deque()  # (index, prompt_code, future or None once the deadline has passed)
+            
+            def submit(index: int):
+                prompt_code = context.prompt_code(line_ranges[index - 1])
+                future = None
+                if not deadline.expired():
+                    future = pool.submit(track, review, deadline.run, self.safe_empathetic_feedback,
+                                         prompt_code, review_comments[index - 1], experience_level)
+                in_flight.append((index, prompt_code, future))
             
-            resources = self.get_relevant_resources(comment)
-            severity_emoji = {"harsh": "🤗", "moderate": "💪", "neutral": "✨"}
-            emoji = severity_emoji.get(feedback.get("severity"), "✨")
+            def collect() -> Tuple[int, Dict]:
+                index, prompt_code, future = in_flight.popleft()
+                if future is not None:
+                    try:
+                        return index, future.result(timeout=deadline.remaining())
+                    except FutureTimeout:
+                        pass
+                return index, self.degraded_feedback(prompt_code, review_comments[index - 1], experience_level)
             
-            section = f"""---
+            try:
+                for index in range(1, len(review_comments) + 1):
+                    submit(index)
+                    if len(in_flight) >= workers * 2:
+                        yield comment_event(*collect())
+                while in_flight:
+                    yield comment_event(*collect())
+            finally:
+                # Requests still running are capped to the deadline, so they end on their own shortly
+                for _, _, future in in_flight:
+                    if future is not None:
+                        future.cancel()
+                pool.shutdown(wait=not deadline.expired())
+        else:
+            for i, (comment, line_range) in enumerate(zip(review_comments, line_ranges), 1):
+                print(f"  ⚡ Processing comment {i}/{len(review_comments)}...")
+                prompt_code = context.prompt_code(line_range)
+                if deadline.expired():
+                    feedback = self.degraded_feedback(prompt_code, comment, experience_level)
+                else:
+                    feedback = track(review, deadline.run, self.safe_empathetic_feedback,
+                                     prompt_code, comment, experience_level)
+                yield comment_event(i, feedback)
+        
+        review["degraded"] = tally.degraded
+        if review["degraded"]:
+            print(f"  ⏱️ Deadline reached: {review['degraded']} comment(s) answered with local guidance")
+        print("  🎯 Generating encouraging summary...")
+        summary = track(review, self.safe_holistic_summary, tally, code_snippet, deadline)
+        yield "finish", summary
+        
+        review["wall_time"] = time.perf_counter() - started_at
+        self.metrics.record_review(review)
+    
+    def build_report_header(self, code_snippet: str, context: SnippetContext = None) -> str:
+        return MarkdownRenderer(self.MAX_REPORT_LINES).header(
+            {"code_snippet": code_snippet, "context": context or SnippetContext(code_snippet)})
+    
+    def build_report_footer(self, summary: str) -> str:
+        return MarkdownRenderer(self.MAX_REPORT_LINES).footer(summary)
 
-### {emoji} Analysis of Comment {i}: "{comment}"
 
-**🌟 Positive Rephrasing:** {feedback['positive_rephrasing']}
+class AsyncEmpatheticCodeReviewer(EmpatheticCodeReviewer):
+    """asyncio counterpart of EmpatheticCodeReviewer for use inside an event loop.
 
-**🧠 The 'Why':** {feedback['why_explanation']}
+    make_groq_request, generate_empathetic_feedback, generate_holistic_summary and
+    process_review are coroutines; heuristics, prompts, parsing, the response cache
+    and the rate limiter are shared with the synchronous reviewer. Pass one
+    httpx.AsyncClient as client to share connections between reviewers.
 
-**💡 Suggested Improvement:**
-```python
-{feedback['code_improvement']}
-```"""
-            if resources:
-                section += "\n\n**📚 Helpful Resources:**\n"
-                for resource in resources:
-                    section += f"- [{resource}]({resource})\n"
+    batch_comments and stream_responses are not supported, and neither are the synchronous
+    streaming entry points (iter_review, iter_feedback, write_review): they raise TypeError.
+    """
+    
+    def __init__(self, max_workers: int = 4, max_connections: int = 20, client=None, **kwargs):
+        unsupported = [option for option in ("batch_comments", "stream_responses") if kwargs.get(option)]
+        if unsupported:
+            raise TypeError(f"AsyncEmpatheticCodeReviewer does not support {' or '.join(unsupported)}; "
+                            f"use EmpatheticCodeReviewer for them")
+        super().__init__(max_workers=max_workers, **kwargs)
+        self.max_connections = max_connections
+        self.client = client
+        self.owns_client = client is None
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+    
+    def get_client(self):
+        if self.client is None:
+            import httpx
+            self.client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+            )
+        return self.client
+    
+    async def aclose(self):
+        if self.client is not None and self.owns_client:
+            await self.client.aclose()
+            self.client = None
+        self.close()
+    
+    async def make_groq_request(self, messages: List[Dict], max_tokens: int = 500, temperature: float = 0.7,
+                                use_cache: bool = True, stage: str = "feedback", response_format: Dict = None,
+                                validate: Callable[[str], bool] = None) -> str:
+        """Make a request to Groq API without blocking the event loop (see the sync version for validate)"""
+        call = self.new_call(stage)
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+        }
+        if response_format:
+            payload["response_format"] = response_format
+        
+        key = ResponseCache.make_key(self.model, messages, max_tokens, temperature) if use_cache else None
+        if key:
+            cached = self.cache.get(key)
+            if cached is not None and (validate is None or validate(cached)):
+                call["cached"] = True
+                self.finish_call(call)
+                return cached
+        
+        try:
+            content = await self.request_with_retries(payload, call)
+        except DeadlineExceeded:
+            self.finish_deadline_call(call)
+            raise
+        if content is None:
+            call["fallback"] = True
+            self.finish_call(call)
+            return self.get_fallback_response()
+        if key and (validate is None or validate(content)):
+            self.cache.set(key, content)
+        self.finish_call(call)
+        return content
+    
+    async def request_with_retries(self, payload: Dict, call: Dict = None) -> Optional[str]:
+        import asyncio
+        self.ensure_api_key()
+        call = call if call is not None else {}
+        deadline = CURRENT_DEADLINE.get()
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            call["retries"] = attempt
+            retryable = False
+            retry_after = None
+            async for backend in self.router.route_async():
+                if deadline:
+                    deadline.check()
+                started_at = time.perf_counter()
+                try:
+                    content = await self.request_once(backend, payload, call)
+                except BackendError as e:
+                    backend.record(False, time.perf_counter() - started_at)
+                    last_error = e
+                    retryable = retryable or e.retryable
+                    retry_after = max(retry_after or 0.0, e.retry_after or 0.0)
+                    if not e.retryable:
+                        print(f"Error calling {backend.name}: {e}")
+                    continue
+                backend.record(True, time.perf_counter() - started_at)
+                call["backend"] = backend.name
+                call["model"] = backend.model
+                return content
             
-            markdown_sections.append(section)
+            if not retryable:
+                break
+            if attempt < self.max_retries:
+                delay = self.backoff_delay(attempt, retry_after)
+                self.wait_for_retry(deadline, delay)
+                await asyncio.sleep(delay)
         
-        print("  🎯 Generating encouraging summary...")
-        summary = self.generate_holistic_summary(feedback_items, code_snippet)
+        print(f"Error calling Groq API after {call['retries'] + 1} attempts: {last_error}")
+        call["error"] = str(last_error)
+        return None
+    
+    async def request_once(self, backend: LLMBackend, payload: Dict, call: Dict = None) -> str:
+        import httpx
+        deadline = CURRENT_DEADLINE.get() or Deadline()
+        sent = backend.payload(payload)
+        try:
+            response = await self.get_client().post(backend.base_url, json=sent, headers=backend.headers,
+                                                    timeout=httpx.Timeout(deadline.cap(self.read_timeout),
+                                                                          connect=deadline.cap(self.connect_timeout)))
+            backend.rate_limiter.update_from_headers(response.headers)
+            if backend.rejected_json_schema(sent, response):
+                return await self.request_once(backend, payload, call)
+            if response.status_code in RETRYABLE_STATUS:
+                retry_after = parse_duration(response.headers.get("Retry-After", ""))
+                if response.status_code == 429:
+                    backend.rate_limiter.pause(retry_after or self.backoff_base)
+                raise BackendError(f"HTTP {response.status_code}", retry_after=retry_after)
+            response.raise_for_status()
+            data = response.json()
+            if call is not None:
+                self.record_usage(call, data)
+            return data["choices"][0]["message"]["content"]
+        except httpx.TransportError as e:
+            raise BackendError(str(e))
+        except httpx.HTTPError as e:
+            raise BackendError(str(e), retryable=False)
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            raise BackendError(f"Unexpected response: {e}", retryable=False)
+    
+    async def generate_empathetic_feedback(self, code_snippet: str, original_comment: str,
+                                           experience_level: str = None) -> Dict[str, str]:
+        severity = self.analyze_comment_severity(original_comment)
+        experience_level = experience_level or self.detect_experience_level(code_snippet)
+        local = self.answer_locally(code_snippet, original_comment, severity, experience_level)
+        if local:
+            return local
+        stored = self.lookup_stored_feedback(code_snippet, original_comment, severity, experience_level)
+        if stored:
+            return stored
+        messages = self.build_feedback_messages(code_snippet, original_comment, severity, experience_level)
         
-        markdown_sections.extend([
-            "\n---\n",
-            "## 🎯 Overall Summary",
-            "",
-            summary,
-            "",
-            "---",
-            "",
-            "*Remember: Every expert was once a beginner.*",
-            "",
-            f"*Generated with ❤️ by Empathetic Code Reviewer using Groq AI*"
-        ])
+        if self.structured_output:
+            response_content = await self.make_groq_request(messages, max_tokens=600, temperature=0.7,
+                                                            response_format=self.feedback_format(),
+                                                            validate=self.is_complete)
+            parsed_response = self.parse_structured_response(response_content)
+            missing = self.missing_fields(parsed_response, response_content)
+            if missing:
+                retry_content = await self.make_groq_request(
+                    self.build_reask_messages(messages, response_content, missing),
+                    max_tokens=400, temperature=0.3, stage="reask", response_format=self.feedback_format(missing),
+                    validate=lambda content: self.is_complete(content, missing))
+                self.merge_reask(parsed_response, retry_content, missing)
+        else:
+            response_content = await self.make_groq_request(messages, max_tokens=600, temperature=0.7,
+                                                            validate=self.is_complete)
+            parsed_response = self.parse_groq_response(response_content)
+            self.missing_fields(parsed_response, response_content)
+        self.store_feedback(code_snippet, original_comment, response_content, parsed_response)
+        parsed_response["severity"] = severity
+        parsed_response["experience_level"] = experience_level
+        return parsed_response
+    
+    async def generate_holistic_summary(self, feedback_items: Union[List[Dict], FeedbackTally], code_snippet: str,
+                                        max_tokens: int = 200) -> str:
+        messages = self.build_summary_messages(feedback_items, code_snippet)
+        summary = await self.make_groq_request(messages, max_tokens=max_tokens, temperature=0.8, stage="summary")
+        return summary.strip()
+    
+    async def safe_holistic_summary(self, feedback_items: Union[List[Dict], FeedbackTally], code_snippet: str, deadline: Deadline) -> str:
+        import asyncio
+        max_tokens = self.summary_budget(deadline)
+        if max_tokens is None:
+            return self.local_summary(feedback_items)
+        try:
+            return await asyncio.wait_for(self.generate_holistic_summary(feedback_items, code_snippet, max_tokens),
+                                          deadline.remaining())
+        except (DeadlineExceeded, asyncio.TimeoutError):
+            return self.local_summary(feedback_items)
+    
+    async def safe_empathetic_feedback(self, code_snippet: str, original_comment: str,
+                                       experience_level: str = None,
+                                       semaphore: asyncio.Semaphore = None) -> Dict[str, str]:
+        try:
+            if semaphore is None:
+                return await self.generate_empathetic_feedback(code_snippet, original_comment, experience_level)
+            async with semaphore:
+                return await self.generate_empathetic_feedback(code_snippet, original_comment, experience_level)
+        except ConfigurationError:
+            raise
+        except DeadlineExceeded:
+            return self.degraded_feedback(code_snippet, original_comment, experience_level)
+        except Exception as e:
+            print(f"Error generating feedback: {e}")
+            return self.fallback_feedback(code_snippet, original_comment, experience_level)
+    
+    async def process_review(self, input_data: Dict, max_workers: int = None, deadline: float = None) -> str:
+        import asyncio
+        deadline = Deadline(self.review_deadline if deadline is None else deadline)
+        prepared = self.prepare_review(input_data)
+        code_snippet = prepared["code_snippet"]
+        review_comments = prepared["comments"]
+        line_ranges = prepared["line_ranges"]
+        prompt_codes = [prepared["context"].prompt_code(line_range) for line_range in line_ranges]
+        experience_level = prepared["experience_level"]
+        semaphore = asyncio.Semaphore(max_workers or self.max_workers)
+        review = ReviewMetrics.new_review(len(review_comments))
+        started_at = time.perf_counter()
         
-        return '\n'.join(markdown_sections)
+        # Tasks created below inherit the context, so their calls count toward this review
+        # and are capped to its deadline
+        token = CURRENT_REVIEW.set(review)
+        deadline_token = CURRENT_DEADLINE.set(deadline)
+        try:
+            tasks = [asyncio.ensure_future(self.safe_empathetic_feedback(prompt_code, comment, experience_level, semaphore))
+                     for comment, prompt_code in zip(review_comments, prompt_codes)]
+            if tasks:
+                await asyncio.wait(tasks, timeout=deadline.remaining())
+            feedback_items = []
+            for task, comment, prompt_code in zip(tasks, review_comments, prompt_codes):
+                if task.done():
+                    feedback_items.append(task.result())
+                else:
+                    task.cancel()
+                    feedback_items.append(self.degraded_feedback(prompt_code, comment, experience_level))
+            review["degraded"] = sum(1 for f in feedback_items if f.get("degraded"))
+            summary = await self.safe_holistic_summary(feedback_items, code_snippet, deadline)
+        finally:
+            CURRENT_DEADLINE.reset(deadline_token)
+            CURRENT_REVIEW.reset(token)
+        review["wall_time"] = time.perf_counter() - started_at
+        self.metrics.record_review(review)
+        
+        sections = [self.build_report_header(code_snippet, prepared["context"])]
+        for i, (comment, feedback) in enumerate(zip(review_comments, feedback_items), 1):
+            sections.append(self.build_comment_section(i, comment, feedback, line_ranges[i - 1]))
+        sections.append(self.build_report_footer(summary))
+        return '\n'.join(sections)
+    
+    def sync_only(self, name: str):
+        raise TypeError(f"{name}() would call this reviewer's coroutines without awaiting them; "
+                        f"AsyncEmpatheticCodeReviewer only supports 'await process_review(...)'")
+    
+    def iter_review(self, *args, **kwargs) -> Iterator[str]:
+        self.sync_only("iter_review")
+    
+    def iter_feedback(self, *args, **kwargs) -> Iterator[Tuple[str, object]]:
+        self.sync_only("iter_feedback")
+    
+    def write_review(self, *args, **kwargs):
+        self.sync_only("write_review")
+    
+    def generate_batched_feedback(self, *args, **kwargs) -> List[Dict]:
+        self.sync_only("generate_batched_feedback")
+    
+    def request_batched_feedback(self, *args, **kwargs) -> Dict[int, Dict[str, str]]:
+        self.sync_only("request_batched_feedback")
 
 
-def run_demo_test():
-    reviewer = EmpatheticCodeReviewer()
+def run_demo_test(report_format: str = "markdown", report_path: str = None) -> str:
+    """Review a small sample snippet, write the report in report_format (see RENDERERS) and return it"""
+    reviewer = EmpatheticCodeReviewer(max_workers=3)
     test_input = {
         "code_snippet": "def get_active_users(users):\n    results = []\n    for u in users:\n        if u.is_active == True and u.profile_complete == True:\n            results.append(u)\n    return results",
         "review_comments": [
@@ -250,12 +2930,503 @@ def run_demo_test():
     }
     print("\n🎯 Running Empathetic Code Review...")
     print("=" * 50)
-    result = reviewer.process_review(test_input)
-    with open("empathetic_review.md", "w", encoding="utf-8") as f:
-        f.write(result)
-    print(f"\n💾 Report saved to 'empathetic_review.md'")
-    return result
+    renderer = RENDERERS[report_format]()
+    report_path = report_path or "empathetic_review" + renderer.extension
+    with open(report_path, "w", encoding="utf-8") as f:
+        # Sections land in the file as soon as each comment is ready
+        reviewer.write_review(test_input, f, renderer=renderer)
+    print(f"\n💾 Report saved to '{report_path}'")
+    with open(report_path, encoding="utf-8") as f:
+        return f.read()
+
+
+class BatchCheckpoint:
+    """Tracks finished job indices as a low watermark plus the few done out of order.
+
+    Jobs that failed or came back incomplete still move the watermark on, so one failure
+    does not pin it; their indices go to an append-only retry log (path + ".retry") and
+    is_done reports them as not done, so a resumed run retries exactly those jobs.
+    """
+    
+    def __init__(self, path: str = None):
+        self.path = path
+        self.next_index = 0  # every job below this index is finished or in failed
+        self.done = set()
+        self.failed = set()  # finished without a usable result; retried on resume
+        self.retry_log = None
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                state = json.load(f)
+            self.next_index = state["next"]
+            self.done = set(state["done"])
+        if path and os.path.exists(f"{path}.retry"):
+            # "+index" failed, "-index" succeeded on a later retry
+            with open(f"{path}.retry", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line[:1] == "+":
+                        self.failed.add(int(line[1:]))
+                    elif line[:1] == "-":
+                        self.failed.discard(int(line[1:]))
+    
+    def log_retry(self, entry: str):
+        if not self.path:
+            return
+        if self.retry_log is None:
+            # Start each run from a compacted log so it does not grow across resumes
+            retry_path, tmp_path = f"{self.path}.retry", f"{self.path}.retry.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.writelines(f"+{index}\n" for index in sorted(self.failed))
+            os.replace(tmp_path, retry_path)
+            self.retry_log = open(retry_path, "a", encoding="utf-8")
+        self.retry_log.write(entry + "\n")
+        self.retry_log.flush()
+    
+    def is_done(self, index: int) -> bool:
+        return (index < self.next_index or index in self.done) and index not in self.failed
+    
+    def mark_done(self, index: int, failed: bool = False):
+        """Record a finished job; failed ones are logged for the next resume to retry"""
+        if failed != (index in self.failed):
+            self.log_retry(f"{'+' if failed else '-'}{index}")
+        (self.failed.add if failed else self.failed.discard)(index)
+        if index >= self.next_index:
+            self.done.add(index)
+            while self.next_index in self.done:
+                self.done.remove(self.next_index)
+                self.next_index += 1
+        self.save()
+    
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"next": self.next_index, "done": sorted(self.done)}, f)
+        os.replace(tmp_path, self.path)
+    
+    def close(self):
+        if self.retry_log:
+            self.retry_log.close()
+            self.retry_log = None
+
+
+def iter_jobs(input_path: str):
+    """Yield (index, raw_line) from a JSONL file or '-' for stdin, one line at a time"""
+    stream = sys.stdin if input_path == "-" else open(input_path, encoding="utf-8")
+    try:
+        index = 0
+        for line in stream:
+            if line.strip():
+                yield index, line
+                index += 1
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def make_batch_reviewer(options: Dict = None, rate_limiter: RateLimiter = None) -> EmpatheticCodeReviewer:
+    """Build a reviewer from plain, picklable options so every batch worker process can make its own.
+
+    Besides EmpatheticCodeReviewer keyword arguments, options may hold feedback_store (a SQLite
+    path), similarity, local_rules (bool), cache (False disables it) and base_url.
+    """
+    options = dict(options or {})
+    store_path = options.pop("feedback_store", None)
+    similarity = options.pop("similarity", 0.6)
+    local_rules = options.pop("local_rules", False)
+    use_cache = options.pop("cache", True)
+    base_url = options.pop("base_url", None)
+    reviewer = EmpatheticCodeReviewer(
+        rate_limiter=rate_limiter,
+        feedback_store=FeedbackStore(store_path, threshold=similarity) if store_path else None,
+        rule_engine=LocalRuleEngine() if local_rules else None,
+        cache=None if use_cache else ResponseCache(bypass=True),
+        **options)
+    if base_url:
+        reviewer.base_url = base_url
+    return reviewer
+
+
+def review_job(reviewer: EmpatheticCodeReviewer, index: int, line: str) -> Dict:
+    try:
+        job = json.loads(line)
+        job_id = str(job.get("id", f"job-{index:06d}"))
+        review = {}
+        report = reviewer.process_review(job, record=review)
+        result = {"index": index, "id": job_id, "report": report}
+        if review["failed_calls"]:
+            result["incomplete"] = f"{review['failed_calls']} LLM call(s) fell back to canned text"
+        return result
+    except Exception as e:
+        return {"index": index, "id": f"job-{index:06d}", "error": str(e)}
+
+
+# The reviewer of a batch worker process (see init_batch_process)
+batch_process_reviewer = None
+
+
+def init_batch_process(options: Dict, limiter_state):
+    global batch_process_reviewer
+    sys.stdout = sys.stderr  # progress output must not mix into a '-' JSONL output stream
+    batch_process_reviewer = make_batch_reviewer(options, SharedRateLimiter(state=limiter_state))
+
+
+def run_batch_process_job(index: int, line: str) -> Tuple[Dict, int, Dict]:
+    """Run one job in a worker process; also returns its pid and cumulative metrics for merging"""
+    result = review_job(batch_process_reviewer, index, line)
+    return result, os.getpid(), batch_process_reviewer.metrics.snapshot()
+
+
+def run_batch(input_path: str, output_path: str = None, out_dir: str = None, workers: int = 4,
+              checkpoint_path: str = None, reviewer: EmpatheticCodeReviewer = None,
+              processes: int = 0, reviewer_options: Dict = None, metrics: ReviewMetrics = None,
+              rate_limiter: SharedRateLimiter = None) -> int:
+    """Stream JSONL review jobs through a bounded worker pool, writing each report as it finishes.
+
+    With processes > 1 the jobs are sharded across that many worker processes instead,
+    each with its own reviewer built from reviewer_options and one rate limit shared by
+    all of them; results are then written in input order so runs are reproducible, and
+    the workers' metrics are merged into metrics.
+
+    A resumed run appends to output_path and retries the jobs that failed or came back
+    incomplete, so such a job can have several result lines: the last one for an id wins.
+    """
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+    if processes > 1:
+        return run_batch_processes(input_path, output_path, out_dir, processes, checkpoint_path,
+                                   reviewer_options, metrics, rate_limiter)
+    reviewer = reviewer or EmpatheticCodeReviewer()
+    checkpoint = BatchCheckpoint(checkpoint_path)
+    real_stdout = sys.stdout
+    output = open_batch_output(output_path, out_dir, checkpoint)
+    write_lock = threading.Lock()
+    completed = 0
+    
+    def write_result(result: Dict):
+        with write_lock:
+            write_batch_result(result, output, out_dir, checkpoint)
+    
+    # Progress output goes to stderr so a '-' output stream stays valid JSONL
+    with contextlib.redirect_stdout(sys.stderr), ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for index, line in iter_jobs(input_path):
+            if checkpoint.is_done(index):
+                continue
+            if len(pending) >= workers * 2:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    write_result(future.result())
+                    completed += 1
+            pending.add(pool.submit(review_job, reviewer, index, line))
+        for future in pending:
+            write_result(future.result())
+            completed += 1
+    
+    if output and output is not real_stdout:
+        output.close()
+    checkpoint.close()
+    print(f"✅ Batch finished: {completed} jobs processed", file=sys.stderr)
+    return completed
+
+
+def open_batch_output(output_path: str, out_dir: str, checkpoint: BatchCheckpoint):
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    if output_path == "-":
+        return sys.stdout
+    if output_path:
+        return open(output_path, "a" if checkpoint.next_index or checkpoint.done else "w", encoding="utf-8")
+    return None
+
+
+def write_batch_result(result: Dict, output, out_dir: str, checkpoint: BatchCheckpoint):
+    if "error" in result:
+        print(f"❌ Job {result['id']} failed: {result['error']}", file=sys.stderr)
+    elif "incomplete" in result:
+        print(f"⚠️ Job {result['id']} incomplete: {result['incomplete']}", file=sys.stderr)
+    if out_dir and "report" in result:
+        file_name = re.sub(r'[^\w.-]', '_', result["id"]) + ".md"
+        with open(os.path.join(out_dir, file_name), "w", encoding="utf-8") as f:
+            f.write(result["report"])
+    if output:
+        output.write(json.dumps(result, ensure_ascii=False) + "\n")
+        output.flush()
+    # Failed and incomplete jobs are checkpointed as failed so a resumed run retries them
+    checkpoint.mark_done(result["index"], failed="error" in result or "incomplete" in result)
+
+
+def run_batch_processes(input_path: str, output_path: str = None, out_dir: str = None, processes: int = 2,
+                        checkpoint_path: str = None, reviewer_options: Dict = None,
+                        metrics: ReviewMetrics = None, rate_limiter: SharedRateLimiter = None) -> int:
+    """Process-pool variant of run_batch: CPU-side work (parsing, heuristics, report assembly,
+    JSON) runs in parallel instead of under one interpreter's GIL"""
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+    checkpoint = BatchCheckpoint(checkpoint_path)
+    output = open_batch_output(output_path, out_dir, checkpoint)
+    rate_limiter = rate_limiter or SharedRateLimiter()
+    submitted = deque()  # futures in input order; results are written strictly in this order
+    snapshots = {}  # worker pid -> its latest cumulative metrics snapshot
+    completed = 0
+    
+    def write_ready(block: bool):
+        nonlocal completed
+        while submitted and (block or submitted[0].done()):
+            result, pid, snapshot = submitted.popleft().result()
+            snapshots[pid] = snapshot
+            write_batch_result(result, output, out_dir, checkpoint)
+            completed += 1
+    
+    with ProcessPoolExecutor(max_workers=processes, initializer=init_batch_process,
+                             initargs=(reviewer_options or {}, rate_limiter.state)) as pool:
+        for index, line in iter_jobs(input_path):
+            if checkpoint.is_done(index):
+                continue
+            # Bound both running jobs and finished ones held back behind a slow earlier job
+            while len(submitted) >= processes * 4:
+                wait([future for future in submitted if not future.done()], return_when=FIRST_COMPLETED)
+                write_ready(block=False)
+            submitted.append(pool.submit(run_batch_process_job, index, line))
+            write_ready(block=False)
+        write_ready(block=True)
+    
+    if output and output is not sys.stdout:
+        output.close()
+    checkpoint.close()
+    if metrics is not None:
+        for snapshot in snapshots.values():
+            metrics.absorb(snapshot)
+    print(f"✅ Batch finished: {completed} jobs processed across {processes} processes", file=sys.stderr)
+    return completed
+
+
+class ReviewServer:
+    """Long-lived HTTP/JSON service sharing one reviewer (connections, cache, rate limits) across clients.
+
+    POST /review takes a process_review payload and answers {"report": ...}. Reviews run
+    on a fixed worker pool behind a bounded queue; when the queue is full the server
+    answers 503 with Retry-After instead of piling up work. GET /health, GET /queue and
+    GET /metrics report liveness, queue depth and Prometheus metrics.
+    """
+    
+    def __init__(self, reviewer: EmpatheticCodeReviewer = None, host: str = "127.0.0.1", port: int = 8000,
+                 workers: int = 4, queue_size: int = 32):
+        from concurrent.futures import ThreadPoolExecutor
+        from http.server import ThreadingHTTPServer
+        self.reviewer = reviewer or EmpatheticCodeReviewer(max_workers=4)
+        self.workers = workers
+        self.queue_size = queue_size
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.slots = threading.BoundedSemaphore(workers + queue_size)
+        self.lock = threading.Lock()
+        self.stats = {"admitted": 0, "running": 0, "completed": 0, "failed": 0, "rejected": 0}
+        self.httpd = ThreadingHTTPServer((host, port), self.make_handler())
+        self.httpd.daemon_threads = True
+    
+    @property
+    def port(self) -> int:
+        return self.httpd.server_port
+    
+    def queue_state(self) -> Dict:
+        with self.lock:
+            in_system = self.stats["admitted"] - self.stats["completed"] - self.stats["failed"]
+            return {
+                "queued": in_system - self.stats["running"],
+                "running": self.stats["running"],
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "completed": self.stats["completed"],
+                "failed": self.stats["failed"],
+                "rejected": self.stats["rejected"],
+                "inflight_upstream": len(self.reviewer.inflight),
+            }
+    
+    def submit(self, input_data: Dict):
+        """Queue a review; returns a Future, or None when the server is saturated"""
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.stats["rejected"] += 1
+            return None
+        with self.lock:
+            self.stats["admitted"] += 1
+        return self.pool.submit(self.run_review, input_data)
+    
+    def run_review(self, input_data: Dict) -> str:
+        with self.lock:
+            self.stats["running"] += 1
+        outcome = "failed"
+        try:
+            report = self.reviewer.process_review(input_data)
+            outcome = "completed"
+            return report
+        finally:
+            with self.lock:
+                self.stats["running"] -= 1
+                self.stats[outcome] += 1
+            self.slots.release()
+    
+    def make_handler(self):
+        from http.server import BaseHTTPRequestHandler
+        server = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            
+            def log_message(self, format, *args):
+                print(f"🌐 {self.address_string()} {format % args}", file=sys.stderr)
+            
+            def send_json(self, status: int, data: Dict, headers: Dict = None):
+                body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def do_GET(self):
+                if self.path == "/health":
+                    self.send_json(200, {"status": "ok"})
+                elif self.path == "/queue":
+                    self.send_json(200, server.queue_state())
+                elif self.path == "/metrics":
+                    body = server.reviewer.metrics.to_prometheus().encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                else:
+                    self.send_json(404, {"error": "not found"})
+            
+            def do_POST(self):
+                if self.path != "/review":
+                    self.send_json(404, {"error": "not found"})
+                    return
+                try:
+                    payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                    if not isinstance(payload.get("code_snippet"), str) or not isinstance(payload.get("review_comments"), list):
+                        raise ValueError("expected {code_snippet: str, review_comments: [str]}")
+                except (ValueError, AttributeError) as e:
+                    self.send_json(400, {"error": str(e)})
+                    return
+                
+                future = server.submit(payload)
+                if future is None:
+                    self.send_json(503, {"error": "server busy, retry later"}, {"Retry-After": "1"})
+                    return
+                try:
+                    self.send_json(200, {"report": future.result()})
+                except Exception as e:
+                    self.send_json(500, {"error": str(e)})
+        
+        return Handler
+    
+    def serve_forever(self):
+        print(f"🚀 Empathetic review server listening on http://{self.httpd.server_address[0]}:{self.port}")
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self.shutdown()
+    
+    def shutdown(self):
+        self.httpd.server_close()
+        self.pool.shutdown(wait=False)
+        self.reviewer.close()
+
+
+def main(argv: List[str] = None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Empathetic Code Reviewer using Groq API")
+    parser.add_argument("--format", choices=sorted(RENDERERS), default="markdown",
+                        help="Report format of the demo review")
+    parser.add_argument("--report", help="Where to write the demo report (default: empathetic_review.<ext>)")
+    subparsers = parser.add_subparsers(dest="command")
+    batch = subparsers.add_parser("batch", help="Review a JSONL file of {code_snippet, review_comments} jobs")
+    batch.add_argument("input", help="JSONL job file, or '-' for stdin")
+    batch.add_argument("--output", help="Append one JSON result per line to this file ('-' for stdout)")
+    batch.add_argument("--out-dir", help="Write one markdown report per job into this directory")
+    batch.add_argument("--workers", type=int, help="Number of reviews processed concurrently (default: 4; "
+                                                    "not with --processes, where each process reviews one job at a time)")
+    batch.add_argument("--processes", type=int, default=0,
+                       help="Shard jobs across this many worker processes (shared rate limit, output in input order)")
+    batch.add_argument("--checkpoint", help="Checkpoint file used to resume an interrupted run")
+    batch.add_argument("--batch-comments", action="store_true",
+                       help="Send all comments of a review in one LLM request")
+    batch.add_argument("--feedback-store", help="SQLite file of past feedback reused for similar comments")
+    batch.add_argument("--similarity", type=float, default=0.6, help="Minimum similarity to reuse stored feedback")
+    batch.add_argument("--structured-output", action="store_true",
+                       help="Request JSON feedback and re-ask only for missing fields")
+    batch.add_argument("--structured-format", choices=["json_schema", "json_object"], default="json_schema",
+                       help="response_format of --structured-output (json_object for endpoints without json_schema)")
+    batch.add_argument("--local-rules", action="store_true",
+                       help="Answer common Python issues (== True, range(len()), ...) locally without the LLM")
+    batch.add_argument("--deadline", type=float, help="Seconds each review may take before pending comments degrade")
+    batch.add_argument("--metrics-out", help="Write timing/token metrics here when done (.prom for Prometheus text, else JSON)")
+    serve = subparsers.add_parser("serve", help="Run a local HTTP/JSON review service")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8000)
+    serve.add_argument("--workers", type=int, default=4, help="Reviews processed concurrently")
+    serve.add_argument("--queue-size", type=int, default=32, help="Reviews allowed to wait before answering 503")
+    serve.add_argument("--structured-output", action="store_true",
+                       help="Request JSON feedback and re-ask only for missing fields")
+    serve.add_argument("--structured-format", choices=["json_schema", "json_object"], default="json_schema",
+                       help="response_format of --structured-output (json_object for endpoints without json_schema)")
+    serve.add_argument("--local-rules", action="store_true",
+                       help="Answer common Python issues (== True, range(len()), ...) locally without the LLM")
+    serve.add_argument("--deadline", type=float, help="Seconds each review may take before pending comments degrade")
+    args = parser.parse_args(argv)
+    
+    if args.command == "batch":
+        if not args.output and not args.out_dir:
+            parser.error("batch needs --output and/or --out-dir")
+        if args.processes > 1 and args.workers is not None:
+            parser.error("--workers sizes the thread pool and cannot be combined with --processes")
+        options = {"batch_comments": args.batch_comments, "review_deadline": args.deadline,
+                   "local_rules": args.local_rules, "feedback_store": args.feedback_store,
+                   "similarity": args.similarity, "structured_output": args.structured_output,
+                   "structured_format": args.structured_format}
+        if args.processes > 1:
+            # Worker processes build their own reviewers; only the merged metrics come back
+            metrics = ReviewMetrics()
+            run_batch(args.input, output_path=args.output, out_dir=args.out_dir, checkpoint_path=args.checkpoint,
+                      processes=args.processes, reviewer_options=options, metrics=metrics)
+        else:
+            reviewer = make_batch_reviewer(options)
+            metrics = reviewer.metrics
+            run_batch(args.input, output_path=args.output, out_dir=args.out_dir,
+                      workers=args.workers or 4, checkpoint_path=args.checkpoint, reviewer=reviewer)
+            if reviewer.rule_engine:
+                engine = reviewer.rule_engine
+                print(f"⚡ Local rules: {engine.stats['hits']}/{engine.stats['lookups']} comments answered "
+                      f"without the LLM ({engine.hit_rate():.0%})", file=sys.stderr)
+            if reviewer.feedback_store:
+                feedback_store = reviewer.feedback_store
+                print(f"♻️ Feedback store: {feedback_store.stats['hits']}/{feedback_store.stats['lookups']} "
+                      f"comments reused ({feedback_store.hit_rate():.0%} hit rate)", file=sys.stderr)
+        if args.metrics_out:
+            with open(args.metrics_out, "w", encoding="utf-8") as f:
+                f.write(metrics.to_prometheus() if args.metrics_out.endswith(".prom") else metrics.to_json())
+        formats = metrics.snapshot()["formats"]
+        if formats["responses"]:
+            print(f"🧩 Format: {metrics.format_failure_rate():.0%} of {formats['responses']} answers missed fields; "
+                  f"{formats['reasks']} re-asks, {formats['wasted_reasks']} wasted", file=sys.stderr)
+    elif args.command == "serve":
+        reviewer = EmpatheticCodeReviewer(max_workers=4, review_deadline=args.deadline,
+                                          rule_engine=LocalRuleEngine() if args.local_rules else None,
+                                          structured_output=args.structured_output,
+                                          structured_format=args.structured_format)
+        server = ReviewServer(reviewer, host=args.host, port=args.port, workers=args.workers,
+                              queue_size=args.queue_size)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("\n👋 Server stopped")
+    else:
+        run_demo_test(args.format, args.report)
 
 
 if __name__ == "__main__":
-    run_demo_test()
+    main()
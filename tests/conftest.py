@@ -0,0 +1,34 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import MockLLMServer  # noqa: E402
+from e2 import EmpatheticCodeReviewer, LLMBackend, ResponseCache  # noqa: E402
+
+
+@pytest.fixture
+def mock_server():
+    """Start a MockLLMServer with the given options; every server started is stopped after the test"""
+    servers = []
+
+    def start(**options) -> MockLLMServer:
+        server = MockLLMServer(**dict({"latency": 0.0}, **options))
+        server.start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def make_reviewer(*servers: MockLLMServer, **options) -> EmpatheticCodeReviewer:
+    """A reviewer talking only to the given stub servers (custom backends have no client-side rate limit)
+    and without a response cache"""
+    backends = [LLMBackend(server.url, f"mock-{i}", api_key="test", name=f"mock-{i}")
+                for i, server in enumerate(servers)]
+    options = dict({"backoff_base": 0.01, "cache": ResponseCache(bypass=True)}, **options)
+    return EmpatheticCodeReviewer(backends=backends, **options)
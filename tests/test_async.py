@@ -0,0 +1,45 @@
+import asyncio
+import io
+
+import pytest
+
+from benchmark import MOCK_FIELDS
+from e2 import AsyncEmpatheticCodeReviewer, LLMBackend, ResponseCache
+
+REVIEW = {"code_snippet": "x = 1", "review_comments": ["x is a bad name", "add a docstring"]}
+
+
+def make_async_reviewer(server, **options):
+    backend = LLMBackend(server.url, "mock", api_key="test")
+    return AsyncEmpatheticCodeReviewer(backends=[backend], cache=ResponseCache(bypass=True), **options)
+
+
+def test_process_review_awaits_every_call(mock_server):
+    server = mock_server()
+
+    async def review():
+        async with make_async_reviewer(server) as reviewer:
+            return await reviewer.process_review(REVIEW)
+
+    report = asyncio.run(review())
+    # Two feedback calls and the summary, all answered by the mock
+    assert report.count(MOCK_FIELDS["positive_rephrasing"]) == 3
+    assert server.counts["total"] == 3
+
+
+@pytest.mark.parametrize("option", ["batch_comments", "stream_responses"])
+def test_unsupported_options_are_rejected(option):
+    with pytest.raises(TypeError, match=option):
+        AsyncEmpatheticCodeReviewer(**{option: True})
+
+
+def test_sync_entry_points_raise_type_error(mock_server):
+    reviewer = make_async_reviewer(mock_server())
+    with pytest.raises(TypeError, match="write_review"):
+        reviewer.write_review(REVIEW, io.StringIO())
+    with pytest.raises(TypeError, match="iter_feedback"):
+        reviewer.iter_feedback(REVIEW)
+    with pytest.raises(TypeError, match="iter_review"):
+        reviewer.iter_review(REVIEW)
+    with pytest.raises(TypeError, match="generate_batched_feedback"):
+        reviewer.generate_batched_feedback("x = 1", ["bad"])
@@ -0,0 +1,68 @@
+import time
+
+from benchmark import MOCK_COMPLETION
+from conftest import make_reviewer
+from e2 import RateLimiter
+
+
+def ask(reviewer, text: str) -> str:
+    return reviewer.make_groq_request([{"role": "user", "content": text}])
+
+
+def test_fails_over_to_the_next_backend(mock_server):
+    broken, healthy = mock_server(error_rate=1.0), mock_server()
+    reviewer = make_reviewer(broken, healthy, max_retries=0)
+    assert ask(reviewer, "first") == MOCK_COMPLETION
+    assert (broken.counts["errors"], healthy.counts["ok"]) == (1, 1)
+    # The failure makes the broken backend rank last, so later calls go straight to the healthy one
+    assert [backend.name for backend in reviewer.router.ranked()] == ["mock-1", "mock-0"]
+    for i in range(5):
+        assert ask(reviewer, f"request {i}") == MOCK_COMPLETION
+    assert broken.counts["total"] == 1
+    reviewer.close()
+
+
+def test_all_backends_down_falls_back(mock_server):
+    servers = [mock_server(error_rate=1.0) for _ in range(3)]
+    reviewer = make_reviewer(*servers, max_retries=1)
+    assert ask(reviewer, "anyone?") == reviewer.get_fallback_response()
+    assert [server.counts["total"] for server in servers] == [2, 2, 2]
+    reviewer.close()
+
+
+def test_ranks_backends_by_latency(mock_server):
+    slow, fast = mock_server(latency=0.1), mock_server(latency=0.0)
+    reviewer = make_reviewer(slow, fast)
+    for i in range(10):
+        ask(reviewer, f"request {i}")
+    assert reviewer.router.ranked()[0].name == "mock-1"
+    assert fast.counts["total"] > slow.counts["total"]
+    reviewer.close()
+
+
+def test_ranks_backends_by_error_rate(mock_server):
+    flaky, steady = mock_server(error_rate=0.5, seed=1), mock_server()
+    reviewer = make_reviewer(flaky, steady, max_retries=0)
+    for i in range(20):
+        assert ask(reviewer, f"request {i}") == MOCK_COMPLETION
+    assert reviewer.router.ranked()[0].name == "mock-1"
+    assert steady.counts["ok"] > flaky.counts["ok"]
+    reviewer.close()
+
+
+def test_custom_backends_have_no_client_side_limit(mock_server):
+    reviewer = make_reviewer(mock_server())
+    started_at = time.perf_counter()
+    for i in range(40):
+        ask(reviewer, f"request {i}")
+    assert time.perf_counter() - started_at < 5.0
+    reviewer.close()
+
+
+def test_unlimited_limiter_adopts_rate_limit_headers():
+    limiter = RateLimiter.unlimited()
+    assert all(limiter.try_acquire() == 0 for _ in range(100))
+    limiter.update_from_headers({"x-ratelimit-remaining-requests": "2", "x-ratelimit-reset-requests": "20s"})
+    assert limiter.try_acquire() == 0
+    assert limiter.try_acquire() == 0
+    assert limiter.try_acquire() > 0
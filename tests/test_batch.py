@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+from conftest import make_reviewer
+from e2 import BatchCheckpoint, main, run_batch
+
+
+def write_jobs(path, count):
+    with open(path, "w", encoding="utf-8") as f:
+        for index in range(count):
+            f.write(json.dumps({"id": f"job-{index}", "code_snippet": f"x{index} = {index}",
+                                "review_comments": [f"Name x{index} better"]}) + "\n")
+
+
+def test_resume_retries_jobs_that_fell_back(mock_server, tmp_path):
+    jobs, output, checkpoint = tmp_path / "jobs.jsonl", tmp_path / "out.jsonl", tmp_path / "batch.ckpt"
+    write_jobs(jobs, 3)
+    # Feedback and summary calls of the first job fail; everything after succeeds
+    down = mock_server(script=[500, 500])
+    run_batch(str(jobs), output_path=str(output), workers=1, checkpoint_path=str(checkpoint),
+              reviewer=make_reviewer(down, max_retries=0))
+    results = [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()]
+    assert [("incomplete" in result) for result in results] == [True, False, False]
+    state = BatchCheckpoint(str(checkpoint))
+    assert [state.is_done(index) for index in range(3)] == [False, True, True]
+
+    up = mock_server()
+    assert run_batch(str(jobs), output_path=str(output), workers=1, checkpoint_path=str(checkpoint),
+                     reviewer=make_reviewer(up)) == 1
+    assert up.counts["total"] == 2
+    assert all(BatchCheckpoint(str(checkpoint)).is_done(index) for index in range(3))
+
+
+def test_failed_jobs_are_not_checkpointed(mock_server, tmp_path):
+    jobs, output, checkpoint = tmp_path / "jobs.jsonl", tmp_path / "out.jsonl", tmp_path / "batch.ckpt"
+    jobs.write_text('{"code_snippet": "x = 1"}\n', encoding="utf-8")
+    run_batch(str(jobs), output_path=str(output), workers=1, checkpoint_path=str(checkpoint),
+              reviewer=make_reviewer(mock_server()))
+    assert "error" in json.loads(output.read_text(encoding="utf-8"))
+    assert not BatchCheckpoint(str(checkpoint)).is_done(0)
+
+
+def test_cli_rejects_workers_with_processes(tmp_path, capsys):
+    with pytest.raises(SystemExit):
+        main(["batch", str(tmp_path / "jobs.jsonl"), "--output", "-", "--processes", "2", "--workers", "8"])
+    assert "--workers" in capsys.readouterr().err
+
+
+def test_a_failure_does_not_pin_the_watermark(tmp_path):
+    path = str(tmp_path / "batch.ckpt")
+    checkpoint = BatchCheckpoint(path)
+    checkpoint.mark_done(0, failed=True)
+    for index in range(1, 2000):
+        checkpoint.mark_done(index)
+    checkpoint.close()
+    assert (checkpoint.next_index, checkpoint.done) == (2000, set())
+    resumed = BatchCheckpoint(path)
+    assert [resumed.is_done(index) for index in range(3)] == [False, True, True]
+    resumed.mark_done(0)
+    resumed.close()
+    assert BatchCheckpoint(path).is_done(0)
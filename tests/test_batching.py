@@ -0,0 +1,53 @@
+from conftest import make_reviewer
+from e2 import EmpatheticCodeReviewer, SnippetContext
+
+BLOCK = "=== COMMENT {} ===\nPOSITIVE_REPHRASING: Nice start\nWHY_EXPLANATION: It reads better\nCODE_IMPROVEMENT: pass"
+
+
+def record_prompts(reviewer, batch_answer: str):
+    """Answer batch requests with batch_answer and single-comment requests with one block; returns the prompts"""
+    prompts = []
+
+    def fake_request(messages, **kwargs):
+        prompts.append((kwargs.get("stage"), messages[-1]["content"]))
+        return batch_answer if kwargs.get("stage") == "batch" else BLOCK.format(1).split("\n", 1)[1]
+
+    reviewer.make_groq_request = fake_request
+    return prompts
+
+
+def test_batch_prompt_holds_each_comment_excerpt(mock_server):
+    reviewer = make_reviewer(mock_server(), batch_comments=True)
+    # Comment 3 is missing from the batch answer, so it is re-asked on its own
+    prompts = record_prompts(reviewer, "\n".join(BLOCK.format(n) for n in (1, 2)))
+    code = "\n".join(f"v{n} = {n}" for n in range(1, 1001))
+    report = reviewer.process_review({"code_snippet": code, "review_comments": [
+        {"comment": "Unclear name", "lines": 900},
+        {"comment": "Magic number", "lines": 901},
+        {"comment": "Dead code", "lines": 950},
+    ]})
+    assert 'Analysis of Comment 3: "Dead code"' in report
+    (stage, batch_prompt), (_, reask_prompt) = prompts[:2]
+    assert stage == "batch"
+    assert "v900 = 900" in batch_prompt and "v950 = 950" in batch_prompt
+    # Lines 900 and 901 share one excerpt; line 950 gets its own
+    assert batch_prompt.count("v900 = 900") == 1
+    assert "(code: excerpt 1)" in batch_prompt and "(code: excerpt 2)" in batch_prompt
+    assert "v950 = 950" in reask_prompt and "v1 = 1\n" not in reask_prompt
+    reviewer.close()
+
+
+def test_line_ranges_are_ordered_and_kept_inside_the_file():
+    normalize = EmpatheticCodeReviewer.normalize_comment
+    assert normalize({"comment": "c", "lines": [5, 2]}) == ("c", (2, 5))
+    assert normalize({"comment": "c", "line": 7}) == ("c", (7, 7))
+    for lines in ("12", ["1", "2"], [1, 2, 3], True, 1.5):
+        assert normalize({"comment": "c", "lines": lines}) == ("c", None)
+
+    context = SnippetContext("\n".join(f"v{n} = {n}" for n in range(1, 1001)))
+    assert context.prompt_code((995, 2005)).startswith("# Lines 990-1000 of 1000\n")
+    # Wholly past the end: the opening window, as for a comment without a range
+    assert context.prompt_code((2000, 2005)) == context.prompt_code()
+    assert context.prompt_code((2000, 2005)).startswith("# Lines 1-300 of 1000\nv1 = 1\n")
+    small = SnippetContext("a = 1\nb = 2")
+    assert small.prompt_code((40, 50)) == "a = 1\nb = 2"
@@ -0,0 +1,33 @@
+from conftest import make_reviewer
+from e2 import ResponseCache
+
+
+def test_disk_tier_is_pruned_every_n_writes(tmp_path):
+    cache = ResponseCache(path=str(tmp_path / "cache.db"), max_disk_entries=10, prune_every=5)
+    count = lambda: cache.db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+    for i in range(14):
+        cache.set(f"key-{i}", f"value-{i}")
+    assert count() == 14
+    cache.set("key-14", "value-14")
+    assert count() == 10
+    cache.close()
+    reopened = ResponseCache(path=str(tmp_path / "cache.db"))
+    assert reopened.get("key-14") == "value-14"
+    assert reopened.get("key-0") is None
+    reopened.close()
+
+
+def test_answers_with_blank_fields_are_not_cached(mock_server):
+    code, comment = "x = 1", "Name x better"
+    drifting = mock_server(drift_rate=1.0)
+    reviewer = make_reviewer(drifting, cache=ResponseCache())
+    for _ in range(2):
+        reviewer.generate_empathetic_feedback(code, comment)
+    assert drifting.counts["total"] == 2
+    complete = mock_server()
+    reviewer.base_url = complete.url
+    for _ in range(2):
+        assert all(reviewer.generate_empathetic_feedback(code, comment)[field]
+                   for field in reviewer.FEEDBACK_FIELDS)
+    assert complete.counts["total"] == 1
+    reviewer.close()
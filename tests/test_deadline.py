@@ -0,0 +1,57 @@
+import threading
+import time
+
+import pytest
+
+from conftest import make_reviewer
+
+REVIEW = {"code_snippet": "def f(items):\n    return [x for x in items if x == True]",
+          "review_comments": ["Comparing to True is redundant", "f is a bad name", "No docstring"]}
+
+
+@pytest.mark.parametrize("options", [{"max_workers": 1}, {"max_workers": 3}, {"batch_comments": True}],
+                         ids=["sequential", "threaded", "batched"])
+def test_slow_backend_degrades_within_the_deadline(mock_server, options):
+    reviewer = make_reviewer(mock_server(latency=2.0), **options)
+    started_at = time.perf_counter()
+    report = reviewer.process_review(REVIEW, deadline=0.5)
+    assert time.perf_counter() - started_at < 1.5
+    assert report.count("**Degraded:**") == len(REVIEW["review_comments"])
+    reviewer.close()
+
+
+def review_in_thread(reviewer, deadline, results, name):
+    def run():
+        started_at = time.perf_counter()
+        report = reviewer.process_review(REVIEW, max_workers=1, deadline=deadline)
+        results[name] = (report, time.perf_counter() - started_at)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def test_coalesced_review_keeps_its_own_shorter_deadline(mock_server):
+    reviewer = make_reviewer(mock_server(latency=1.0))
+    results = {}
+    patient = review_in_thread(reviewer, None, results, "patient")
+    time.sleep(0.1)
+    hurried = review_in_thread(reviewer, 0.3, results, "hurried")
+    patient.join(), hurried.join()
+    report, wall_time = results["hurried"]
+    assert wall_time < 1.0 and "**Degraded:**" in report
+    assert "**Degraded:**" not in results["patient"][0]
+    reviewer.close()
+
+
+def test_coalesced_review_without_deadline_does_not_inherit_a_timeout(mock_server):
+    reviewer = make_reviewer(mock_server(latency=1.0))
+    results = {}
+    hurried = review_in_thread(reviewer, 0.3, results, "hurried")
+    time.sleep(0.1)
+    patient = review_in_thread(reviewer, None, results, "patient")
+    patient.join(), hurried.join()
+    assert "**Degraded:**" in results["hurried"][0]
+    report = results["patient"][0]
+    assert "**Degraded:**" not in report and reviewer.get_fallback_response() not in report
+    reviewer.close()
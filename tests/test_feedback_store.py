@@ -0,0 +1,38 @@
+from conftest import make_reviewer
+from e2 import FeedbackStore
+
+CODE = "for u in users:\n    print(u)"
+FEEDBACK = {"positive_rephrasing": "Consider a more descriptive name than 'u'", "why_explanation": "Clarity",
+            "code_improvement": "for user in users:\n    print(user)"}
+
+
+def test_reuses_feedback_for_a_reworded_comment():
+    store = FeedbackStore()
+    store.add("Variable 'u' is a bad name.", CODE, FEEDBACK)
+    assert store.lookup("Bad variable name: 'u'", CODE) == FEEDBACK
+    store.close()
+
+
+def test_named_identifiers_must_match():
+    store = FeedbackStore()
+    store.add("Variable 'u' is a bad name.", CODE, FEEDBACK)
+    assert store.lookup("Variable 'y' is a bad name.", CODE) is None
+    assert store.lookup("Variable y is a bad name.", CODE) is None
+    assert store.lookup("Variable name is not bad", CODE) is None
+    assert store.stats["hits"] == 0
+    store.close()
+
+
+def test_batched_reviews_store_and_reuse_feedback(mock_server):
+    server = mock_server()
+    reviewer = make_reviewer(server, batch_comments=True, feedback_store=FeedbackStore())
+    review = {"code_snippet": CODE, "review_comments": ["Variable 'u' is a bad name.", "Printing here is wrong."]}
+    reviewer.process_review(review)
+    calls = server.counts["total"]
+    assert reviewer.feedback_store.stats["hits"] == 0
+
+    reviewer.process_review(dict(review, review_comments=["Bad variable name: 'u'"]))
+    # Only the summary went upstream; the comment was answered from the store
+    assert server.counts["total"] - calls == 1
+    assert reviewer.feedback_store.stats["hits"] == 1
+    reviewer.close()
@@ -0,0 +1,105 @@
+import time
+
+from benchmark import MOCK_COMPLETION
+from conftest import make_reviewer
+from e2 import RateLimiter, ResponseCache, SharedRateLimiter
+
+MESSAGES = [{"role": "user", "content": "Rephrase: this is bad"}]
+
+
+def test_429_waits_for_retry_after(mock_server):
+    server = mock_server(script=[429], retry_after=0.3)
+    reviewer = make_reviewer(server)
+    started_at = time.perf_counter()
+    assert reviewer.make_groq_request(MESSAGES) == MOCK_COMPLETION
+    assert time.perf_counter() - started_at >= 0.3
+    assert server.counts == {"total": 2, "ok": 1, "errors": 0, "rate_limited": 1}
+    reviewer.close()
+
+
+def test_5xx_is_retried_with_growing_backoff(mock_server):
+    server = mock_server(script=[500, 502, 503])
+    reviewer = make_reviewer(server, max_retries=3)
+    attempts = []
+    backoff_delay = reviewer.backoff_delay
+    reviewer.backoff_delay = lambda attempt, retry_after=None: attempts.append(attempt) or backoff_delay(attempt, retry_after)
+    assert reviewer.make_groq_request(MESSAGES) == MOCK_COMPLETION
+    assert attempts == [0, 1, 2]
+    assert server.counts["total"] == 4
+    reviewer.close()
+
+
+def test_gives_up_after_max_retries(mock_server):
+    server = mock_server(script=[500] * 10)
+    reviewer = make_reviewer(server, max_retries=2)
+    assert reviewer.make_groq_request(MESSAGES) == reviewer.get_fallback_response()
+    assert server.counts["total"] == 3
+    assert reviewer.metrics.snapshot()["stages"]["feedback"]["fallbacks"] == 1
+    reviewer.close()
+
+
+def test_4xx_is_not_retried(mock_server):
+    server = mock_server(script=[400])
+    reviewer = make_reviewer(server, max_retries=3)
+    assert reviewer.make_groq_request(MESSAGES) == reviewer.get_fallback_response()
+    assert server.counts["total"] == 1
+    reviewer.close()
+
+
+def test_read_timeout_is_retried(mock_server):
+    server = mock_server(latency=0.5)
+    reviewer = make_reviewer(server, read_timeout=0.1, max_retries=1)
+    started_at = time.perf_counter()
+    assert reviewer.make_groq_request(MESSAGES) == reviewer.get_fallback_response()
+    assert time.perf_counter() - started_at < 1.0
+    assert server.counts["total"] == 2
+    reviewer.close()
+
+
+def test_session_keeps_connections_alive(mock_server):
+    server = mock_server()
+    reviewer = make_reviewer(server)
+    for i in range(5):
+        reviewer.make_groq_request([{"role": "user", "content": f"request {i}"}])
+    assert server.counts["total"] == 5
+    assert len(server.clients) == 1
+    reviewer.close()
+
+
+def test_rate_limit_headers_never_raise_the_configured_rate():
+    limiter = RateLimiter(rate=0.5, capacity=30)
+    # Groq reports the daily request budget: 14399 left would otherwise mean 80 requests/s
+    limiter.update_from_headers({"x-ratelimit-remaining-requests": "14399", "x-ratelimit-reset-requests": "2m59.56s"})
+    assert limiter.rate == 0.5
+    limiter.update_from_headers({"x-ratelimit-remaining-requests": "3", "x-ratelimit-reset-requests": "60s"})
+    assert limiter.rate == 0.05
+    assert SharedRateLimiter(rate=0.5).max_rate == 0.5
+
+
+def test_streaming_passes_each_delta_on(mock_server):
+    server = mock_server()
+    reviewer = make_reviewer(server)
+    deltas = []
+    assert reviewer.make_groq_request(MESSAGES, on_delta=deltas.append) == MOCK_COMPLETION
+    assert len(deltas) > 1 and "".join(deltas) == MOCK_COMPLETION
+    reviewer.close()
+
+
+def test_empty_event_stream_is_a_failure(mock_server):
+    server = mock_server(streaming=False)
+    reviewer = make_reviewer(server, stream_responses=True, cache=ResponseCache())
+    for _ in range(2):
+        assert reviewer.make_groq_request(MESSAGES) == reviewer.get_fallback_response()
+    # Nothing was cached, so the second call went upstream again
+    assert server.counts["total"] == 2
+    reviewer.close()
+
+
+def test_streaming_records_token_usage(mock_server):
+    server = mock_server()
+    reviewer = make_reviewer(server, stream_responses=True)
+    assert reviewer.make_groq_request(MESSAGES, stage="rephrase") == MOCK_COMPLETION
+    totals = reviewer.metrics.stages["rephrase"]
+    assert totals["prompt_tokens"] == len(MESSAGES[0]["content"]) // 4
+    assert totals["completion_tokens"] == len(MOCK_COMPLETION) // 4
+    reviewer.close()
@@ -0,0 +1,41 @@
+import ast
+import builtins
+import os
+
+from benchmark import measure_import
+
+IMPORT_BUDGET_MS = 50.0
+E2_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "e2.py")
+
+
+def test_import_stays_within_budget():
+    timings, eager = measure_import(runs=3)
+    assert eager == [], f"heavy modules imported eagerly: {eager}"
+    assert min(timings) <= IMPORT_BUDGET_MS
+
+
+def test_annotations_only_use_module_level_names():
+    """Lazily imported modules used in annotations need an `if TYPE_CHECKING:` import"""
+    tree = ast.parse(open(E2_PATH, encoding="utf-8").read())
+    defined = set(dir(builtins))
+    for node in tree.body:
+        statements = node.body if isinstance(node, ast.If) else [node]
+        for statement in statements:
+            if isinstance(statement, (ast.Import, ast.ImportFrom)):
+                defined |= {(alias.asname or alias.name).split(".")[0] for alias in statement.names}
+            elif isinstance(statement, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                defined.add(statement.name)
+            elif isinstance(statement, (ast.Assign, ast.AnnAssign)):
+                targets = statement.targets if isinstance(statement, ast.Assign) else [statement.target]
+                defined |= {target.id for target in targets if isinstance(target, ast.Name)}
+    annotations = []
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            arguments = node.args.posonlyargs + node.args.args + node.args.kwonlyargs + [node.args.vararg, node.args.kwarg]
+            annotations += [argument.annotation for argument in arguments if argument and argument.annotation]
+            annotations.append(node.returns)
+        elif isinstance(node, ast.AnnAssign):
+            annotations.append(node.annotation)
+    used = {name.id for annotation in annotations if annotation
+            for name in ast.walk(annotation) if isinstance(name, ast.Name)}
+    assert used - defined == set()
@@ -0,0 +1,77 @@
+from e2 import LocalRuleEngine, SnippetContext
+
+
+def improve(code: str, comment: str) -> str:
+    return LocalRuleEngine().answer(code, comment)["code_improvement"]
+
+
+def test_keeps_comments_and_strings_starting_with_hash():
+    code = ('# check the flag\n'
+            's = """\n'
+            '# not a comment\n'
+            '"""\n'
+            'if flag == True:  # really?\n'
+            '    print(s)  # keep me\n'
+            'elif other == False:\n'
+            '    pass')
+    assert improve(code, "Boolean comparison '== True' is redundant.") == (
+        '# check the flag\n'
+        's = """\n'
+        '# not a comment\n'
+        '"""\n'
+        'if flag:  # really?\n'
+        '    print(s)  # keep me\n'
+        'elif not other:\n'
+        '    pass')
+
+
+def test_only_changed_statements_are_regenerated():
+    code = ("def get_active_users(users):\n"
+            "    # collect the active ones\n"
+            "    results = []\n"
+            "    for u in users:\n"
+            "        if u.is_active:\n"
+            "            results.append(u)\n"
+            "    return results  # done")
+    assert improve(code, "Use a list comprehension") == (
+        "def get_active_users(users):\n"
+        "    # collect the active ones\n"
+        "    results = [u for u in users if u.is_active]\n"
+        "    return results  # done")
+
+
+def test_strips_the_excerpt_header_and_outline():
+    code = "\n".join(f"class C{i}:\n    def f(self, x):\n        return x == True" for i in range(200))
+    excerpt = SnippetContext(code).prompt_code((300, 300))
+    assert excerpt.startswith("# Lines ") and "# Outline of the full file:" in excerpt
+    assert improve(excerpt, "== True is redundant") == "def f(self, x):\n    return x"
+
+
+def test_renames_only_the_named_single_letter():
+    code = "def f(users):\n    for u in users:\n        print(u)"
+    engine = LocalRuleEngine()
+    assert engine.answer(code, "Rename u please")["code_improvement"] == (
+        "def f(users):\n    for user in users:\n        print(user)")
+    # x is not in the code: the comment is about something the rule cannot see, so the LLM answers
+    assert engine.answer(code, "Rename x please") is None
+
+
+def test_append_loop_is_kept_when_its_variable_is_read_afterwards():
+    code = ("out = []\n"
+            "for x in xs:\n"
+            "    out.append(x * 2)\n"
+            "print(x)")
+    assert LocalRuleEngine().answer(code, "Use a list comprehension") is None
+    assert improve(code.replace("print(x)", "print(out)"), "Use a list comprehension") == (
+        "out = [x * 2 for x in xs]\n"
+        "print(out)")
+
+
+def test_prefers_the_rule_the_comment_names_most_specifically():
+    code = ("for i in range(len(users)):\n"
+            "    if users[i].active == True:\n"
+            "        print(users[i])")
+    engine = LocalRuleEngine()
+    assert engine.answer(code, "It is true that this loop could iterate directly")["local_rule"] == "range_len"
+    assert engine.answer(code, "Use enumerate, not range(len(users)) - and drop the == True")["local_rule"] == "range_len"
+    assert engine.answer(code, "This is true, but nothing here is wrong") is None
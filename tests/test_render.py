@@ -0,0 +1,20 @@
+import pytest
+
+import e2
+from conftest import make_reviewer
+
+
+def test_renderers_implement_every_event():
+    with pytest.raises(TypeError):
+        e2.ReportRenderer()
+    for renderer in e2.RENDERERS.values():
+        renderer()
+
+
+def test_demo_returns_the_report(mock_server, monkeypatch, tmp_path):
+    server = mock_server()
+    monkeypatch.setattr(e2, "EmpatheticCodeReviewer", lambda **options: make_reviewer(server, **options))
+    report_path = tmp_path / "review.html"
+    report = e2.run_demo_test("html", str(report_path))
+    assert report == report_path.read_text(encoding="utf-8")
+    assert report.startswith("<!DOCTYPE html>") and "Analysis of Comment 3" in report
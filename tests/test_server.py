@@ -0,0 +1,74 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from conftest import make_reviewer
+from e2 import ReviewServer
+
+REVIEW = {"code_snippet": "def f(x):\n    return x == True", "review_comments": ["Comparing to True is redundant"]}
+
+
+@pytest.fixture
+def review_server():
+    """Start a ReviewServer on a free port around the given reviewer; stopped after the test"""
+    servers = []
+
+    def start(reviewer, **options) -> ReviewServer:
+        server = ReviewServer(reviewer, port=0, **options)
+        threading.Thread(target=server.httpd.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.httpd.shutdown()
+        server.shutdown()
+
+
+def call(server: ReviewServer, path: str, payload: dict = None):
+    """(status, headers, JSON body) of one request to the server"""
+    data = json.dumps(payload).encode("utf-8") if payload is not None else None
+    request = urllib.request.Request(f"http://127.0.0.1:{server.port}{path}", data=data,
+                                     headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.status, response.headers, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, json.loads(e.read())
+
+
+def test_review_round_trip(mock_server, review_server):
+    server = review_server(make_reviewer(mock_server()))
+    status, _, body = call(server, "/review", REVIEW)
+    assert status == 200 and "Comparing to True is redundant" in body["report"]
+    assert call(server, "/review", {"code_snippet": 1})[0] == 400
+    assert call(server, "/health")[2] == {"status": "ok"}
+
+
+def test_saturated_server_answers_503_and_coalesces_identical_reviews(mock_server, review_server):
+    upstream = mock_server(latency=0.4)
+    server = review_server(make_reviewer(upstream), workers=2, queue_size=2)
+    call(server, "/review", REVIEW)
+    calls_per_review = upstream.counts["total"]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        futures = [pool.submit(call, server, "/review", REVIEW) for _ in range(8)]
+        deadline = time.monotonic() + 5
+        while call(server, "/queue")[2]["rejected"] < 4 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        state = call(server, "/queue")[2]
+        assert (state["running"], state["queued"], state["rejected"]) == (2, 2, 4)
+        assert state["inflight_upstream"] == 1
+        results = [future.result() for future in futures]
+
+    assert sorted(status for status, _, _ in results) == [200] * 4 + [503] * 4
+    assert all(headers["Retry-After"] == "1" for status, headers, _ in results if status == 503)
+    # Both workers share each upstream call, so two waves of identical reviews cost two reviews' calls
+    assert upstream.counts["total"] == 3 * calls_per_review
+    state = call(server, "/queue")[2]
+    assert (state["running"], state["queued"], state["completed"]) == (0, 0, 5)
@@ -0,0 +1,34 @@
+import e2
+from conftest import make_reviewer
+
+CODE = "def f(users):\n    for u in users:\n        print(u)"
+
+
+def test_switches_to_json_mode_when_json_schema_is_rejected(mock_server):
+    server = mock_server(json_schema=False)
+    reviewer = make_reviewer(server, structured_output=True)
+    first = reviewer.generate_empathetic_feedback(CODE, "Variable 'u' is a bad name.")
+    assert first["positive_rephrasing"] and first["why_explanation"]
+    assert reviewer.backends[0].json_schema is False
+    # One rejected attempt, then JSON mode straight away for every later request
+    assert server.counts == {"total": 2, "ok": 1, "errors": 1, "rate_limited": 0}
+    reviewer.generate_empathetic_feedback(CODE, "Loop is unclear")
+    assert server.counts["errors"] == 1
+    reviewer.close()
+
+
+def test_other_bad_requests_keep_json_schema(mock_server):
+    server = mock_server(script=[400])
+    reviewer = make_reviewer(server, structured_output=True)
+    reviewer.generate_empathetic_feedback(CODE, "Variable 'u' is a bad name.")
+    assert reviewer.backends[0].json_schema is True
+    reviewer.close()
+
+
+def test_structured_format_option(monkeypatch, tmp_path):
+    reviewers = []
+    monkeypatch.setattr(e2, "run_batch", lambda *args, reviewer=None, **kwargs: reviewers.append(reviewer))
+    e2.main(["batch", str(tmp_path / "jobs.jsonl"), "--output", "-", "--structured-output",
+             "--structured-format", "json_object"])
+    assert reviewers[0].structured_format == "json_object"
+    assert reviewers[0].feedback_format() == {"type": "json_object"}